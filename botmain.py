@@ -1,22 +1,28 @@
 import os
 import asyncio
 import logging
+import time
 import random
 import discord
 from discord.ext import commands
 import asyncpg
 from aiohttp import web
-from PIL import Image
 import io
 import uuid
 from datetime import datetime,timedelta
 from zoneinfo import ZoneInfo
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
 from constants import *
 import utils as u
 import cc
+import metrics
+import queries as q
+import outbound
+import render
+import mediastore
 import aiohttp, http
 from stronghold import PathButtons
+from scheduler import Scheduler
 import re
 chat_xp_cd = commands.CooldownMapping.from_cooldown(
     2,                # max tokens
@@ -40,14 +46,30 @@ if not DATABASE_URL:
 # Bot setup
 DEFAULT_PREFIX = "bc!"
 
+def prefixes_for(bot: commands.Bot, message: discord.Message) -> list[str]:
+    # Pull from cache; fall back to default
+    gid = message.guild.id if message.guild else None
+    pref = _prefix_cache.get(gid, DEFAULT_PREFIX)
+
+    # Accept: @mention, configured prefix, and "!" as a safety fallback
+    return commands.when_mentioned_or(pref, "!")(bot, message)
+
 class BeenBag(commands.Bot):
     async def get_prefix(self, message: discord.Message):
-        # Pull from cache; fall back to default
-        gid = message.guild.id if message.guild else None
-        pref = _prefix_cache.get(gid, DEFAULT_PREFIX)
+        return prefixes_for(self, message)
 
-        # Accept: @mention, configured prefix, and "!" as a safety fallback
-        return commands.when_mentioned_or(pref, "!")(self, message)
+    async def close(self):
+        # write out buffered chat EXP while we can still announce level-ups
+        try:
+            await flush_chat_exp()
+        except Exception:
+            logging.exception("[chat exp] final flush failed")
+        try:
+            await mediastore.flush_touches(db_pool)
+        except Exception:
+            logging.exception("[media] final touch flush failed")
+        render.shutdown()
+        await super().close()
 intents = discord.Intents.default()
 intents.message_content = True
 
@@ -79,7 +101,8 @@ def dynamic_prefix(bot: commands.Bot, message: discord.Message):
 bot = BeenBag(
     command_prefix=DEFAULT_PREFIX,  # not used, overridden by get_prefix
     case_insensitive=True,
-    intents=intents
+    intents=intents,
+    http_trace=metrics.discord_trace_config(),
 )
 bot.remove_command("help")
 #hold an asyncpg pool here
@@ -190,7 +213,7 @@ async def give_fish_food_task():
                 WHERE time_caught < NOW() - INTERVAL '1 day'
             """)
 
-            # 1) Pull at most 30 most-recent fish PER (guild, user)
+            # 1) Pull at most AQUARIUM_MAX_FISH most-recent fish PER (guild, user)
             rows = await conn.fetch("""
                 SELECT guild_id, user_id, color1, color2, type
                 FROM (
@@ -201,8 +224,8 @@ async def give_fish_food_task():
                            ) AS rn
                     FROM aquarium
                 ) AS ranked
-                WHERE rn <= 30
-            """)
+                WHERE rn <= $1
+            """, AQUARIUM_MAX_FISH)
 
             # 2) Group fish by (guild_id, user_id)
             from collections import defaultdict
@@ -218,28 +241,127 @@ async def give_fish_food_task():
                 types   = {f[2] for f in fish_list}
                 total_unique = len(color1s) + len(color2s) + len(types)
 
-                # Upsert into player_items with guild_id in both columns and conflict target
-                await conn.execute("""
-                    INSERT INTO player_items (guild_id, player_id, item_name, category, quantity, useable)
-                    VALUES ($1, $2, 'fish food', 'resource', $3, TRUE)
-                    ON CONFLICT (guild_id, player_id, item_name)
-                    DO UPDATE SET quantity = player_items.quantity + EXCLUDED.quantity
-                """, guild_id, user_id, total_unique)
+                await u.give_items(user_id, "fish food", total_unique, "resource", True, conn, guild_id)
 
         print("✅ Fish food distributed.")
         await asyncio.sleep(1800)  # 30 minutes
 
+# ---------- chat EXP write-behind ----------
+# (guild_id, user_id) -> chat EXP earned since the last flush (0 = only seen, still needs an accountinfo row)
+_pending_chat_exp = {}  # type: dict[tuple[int, int], int]
+# (guild_id, user_id) -> channel of the message that earned the EXP, for level-up fallbacks
+_pending_chat_channel = {}
+# (guild_id, user_id) pairs already written by a flush, so seen-only chatter can skip the DB.
+# Least recently active first; an evicted pair just gets one more (harmless) upsert.
+_known_accounts = OrderedDict()  # type: OrderedDict[tuple[int, int], None]
+KNOWN_ACCOUNTS_MAX = 50_000
+CHAT_EXP_FLUSH_SECONDS = 5
+
+def note_chat_activity(message: discord.Message, exp_gain: int):
+    key = (message.guild.id, message.author.id)
+    if not exp_gain and key in _known_accounts:
+        _known_accounts.move_to_end(key)
+        return
+    _pending_chat_exp[key] = _pending_chat_exp.get(key, 0) + exp_gain
+    if exp_gain:
+        _pending_chat_channel[key] = message.channel
+
+async def flush_chat_exp():
+    """Upsert all buffered chat activity in one statement, then fire any level-ups it caused."""
+    global _pending_chat_exp, _pending_chat_channel
+    if not _pending_chat_exp or db_pool is None:
+        return
+    pending, channels = _pending_chat_exp, _pending_chat_channel
+    _pending_chat_exp, _pending_chat_channel = {}, {}
+    keys = list(pending)
+
+    async with db_pool.acquire() as conn:
+        try:
+            with metrics.timed("beenbag_chat_exp_flush_seconds"):
+                rows = await q.fetch(
+                    conn, "flush_chat_exp",
+                    [k[0] for k in keys], [k[1] for k in keys], [pending[k] for k in keys]
+                )
+        except Exception:
+            # nothing was written; merge the batch back so the next flush retries it
+            for key, exp in pending.items():
+                _pending_chat_exp[key] = _pending_chat_exp.get(key, 0) + exp
+            for key, ch in channels.items():
+                _pending_chat_channel.setdefault(key, ch)
+            raise
+    for key in keys:
+        _known_accounts[key] = None
+        _known_accounts.move_to_end(key)
+    while len(_known_accounts) > KNOWN_ACCOUNTS_MAX:
+        _known_accounts.popitem(last=False)
+
+    for r in rows:
+        key = (r["guild_id"], r["discord_id"])
+        gained = pending[key]
+        if not gained:
+            continue
+        try:
+            await u.apply_level_up(bot, key[0], key[1], r["experience"] - gained, r["experience"], channels.get(key))
+        except Exception:
+            logging.exception(f"[chat exp] level-up handling failed for {key}")
+
+async def chat_exp_flush_task():
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(CHAT_EXP_FLUSH_SECONDS)
+        try:
+            await flush_chat_exp()
+        except Exception:
+            logging.exception("[chat exp] flush failed")
+
+# ---------- media retention ----------
+MEDIA_TOUCH_FLUSH_SECONDS = 60
+MEDIA_GC_SECONDS = 6 * 3600
+
+async def media_retention_task():
+    """Write out which images were used, and every few hours delete the ones nobody uses any more."""
+    await bot.wait_until_ready()
+    next_gc = time.monotonic() + MEDIA_TOUCH_FLUSH_SECONDS  # first run shortly after startup
+    while not bot.is_closed():
+        await asyncio.sleep(MEDIA_TOUCH_FLUSH_SECONDS)
+        try:
+            await mediastore.flush_touches(db_pool)
+            if time.monotonic() >= next_gc:
+                next_gc = time.monotonic() + MEDIA_GC_SECONDS
+                await mediastore.collect_garbage(db_pool)
+        except Exception:
+            logging.exception("[media] retention run failed")
+
 async def init_db():
     """Create a connection pool """
     global db_pool
-    db_pool = await asyncpg.create_pool(DATABASE_URL)
+    # schema first, so the pool's connections can prepare statements that use it
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await mediastore.ensure_schema(conn)
+    finally:
+        await conn.close()
+    db_pool = metrics.TimedPool(await asyncpg.create_pool(
+        DATABASE_URL,
+        connection_class=q.PreparedConnection,
+        init=q.prepare_all,
+    ))
     await cc.init_cc(db_pool)
+    await u.warm_guild_settings(db_pool)
+    await u.warm_level_roles(db_pool)
+    await rebuild_spawn_index()
     logging.info("Postgres connected")
 
 # HTTP endpoints
 async def handle_ping(request):
     return web.Response(text="pong")
 
+async def handle_metrics(request):
+    # if ADMIN_TOKEN is set, scrapers must send it as a bearer token
+    if ADMIN_TOKEN and request.headers.get("Authorization") != f"Bearer {ADMIN_TOKEN}":
+        return web.Response(status=401, text="unauthorized")
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
 
 @bot.event
 async def on_ready():
@@ -248,12 +370,32 @@ async def on_ready():
     #     bot._decay_task = bot.loop.create_task(daily_level_decay())
         # load prefixes into cache
     await warm_prefix_cache()
-    if not hasattr(bot, "_guild_spawn_tasks"):
-        bot._guild_spawn_tasks = {}
     # Start/ensure per‑guild spawners
+    spawn_scheduler.start()
+    if not spawn_scheduler.pending("sweep_expired_spawns"):
+        spawn_scheduler.call_later(0, "sweep_expired_spawns", spawn_sweep_tick)
     start_all_guild_spawn_tasks()
     if not hasattr(bot, "_fishfood_task"):
         bot._fishfood_task = bot.loop.create_task(give_fish_food_task())
+    if not hasattr(bot, "_chat_exp_task"):
+        bot._chat_exp_task = bot.loop.create_task(chat_exp_flush_task())
+    if not hasattr(bot, "_media_retention_task"):
+        bot._media_retention_task = bot.loop.create_task(media_retention_task())
+
+@bot.before_invoke
+async def _start_command_timer(ctx):
+    ctx._started_at = time.perf_counter()
+
+@bot.after_invoke
+async def _stop_command_timer(ctx):
+    # runs even when the command raised; checks that fail never reach before_invoke
+    name = ctx.command.qualified_name if ctx.command else "unknown"
+    metrics.observe("beenbag_command_seconds", time.perf_counter() - ctx._started_at, command=name)
+    metrics.inc("beenbag_commands_total", command=name, outcome="error" if ctx.command_failed else "ok")
+
+async def process_commands_timed(message: discord.Message):
+    with metrics.timed("beenbag_message_stage_seconds", stage="commands"):
+        await bot.process_commands(message)
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -268,29 +410,39 @@ async def on_command_error(ctx, error):
         logging.warning("Suppressed send failure due to rate limit.")
     logging.error(f"Unhandled exception in {ctx.command}: {error}", exc_info=error)
 
+# members who get an automatic reaction in react channels
+_AUTO_REACTIONS = {
+    1381277906017189898: "🙄",
+    1376308591115501618: "🐈",
+}
+
+def looks_like_command(message: discord.Message) -> bool:
+    """Same prefixes process_commands will accept, checked without awaiting anything."""
+    return message.content.startswith(tuple(prefixes_for(bot, message)))
+
 @bot.event
 async def on_message(message):
     if message.author.bot:
         return
+    # DMs have no guild state: no spawns, EXP or reactions, just commands
+    if message.guild is None:
+        return await process_commands_timed(message)
     guild_id = message.guild.id
-    # auto–eye-roll on every message from that specific user
-    # inside on_message, after you computed guild_id
-    async with db_pool.acquire() as conn:
-        react_ids = await conn.fetchval(
-            "SELECT react_channel_ids FROM guild_settings WHERE guild_id=$1",
-            guild_id
-        )
-    react_ids = react_ids or []
-
-    if message.channel.id in react_ids:
-        if message.author.id == 1381277906017189898:
-            try: await message.add_reaction("🙄")
-            except Exception: pass
-        elif message.author.id == 1376308591115501618:
-            try: await message.add_reaction("🐈")
-            except Exception: pass
-    if message.author.bot:
-        return
+
+    # 0) Classify from memory only: capture candidate, command, EXP-eligible, react-only
+    with metrics.timed("beenbag_message_stage_seconds", stage="classify"):
+        now = datetime.utcnow()
+        name = message.content.strip().lower().replace(" ", "")
+        live = match_live_spawn(message.channel.id, name, now)
+        is_command = live is None and looks_like_command(message)
+        can_gain = chat_xp_cd.get_bucket(message).update_rate_limit() is None
+        reaction = _AUTO_REACTIONS.get(message.author.id)
+        if reaction and message.channel.id not in u.get_guild_settings(guild_id)["react_channel_ids"]:
+            reaction = None
+
+    if reaction:
+        try: await message.add_reaction(reaction)
+        except Exception: pass
 
     # # Regex to match flexible time formats like "9:00 PM GMT", "21:00 UTC", "9pm est"
     # match = re.search(r'(\d{1,2}(:\d{2})?\s*(am|pm)?\s*(gmt|utc|est|pst|cet|cst|ist|aest|pdt|edt|bst|jst)?)', message.content, re.IGNORECASE)
@@ -307,135 +459,129 @@ async def on_message(message):
     #         await message.reply(f"{text_time.strip()} → {discord_format}")
     #     else:
     #         await message.reply("Sorry, I couldn't understand the time you mentioned.")
-    # 1) Ensure they exist in accountinfo
+    # 1) Earn chat EXP (buffered, see flush_chat_exp); users with nothing to gain
+    #    only need their accountinfo row created once
+    note_chat_activity(message, 1 if can_gain else 0)
+
+    if live is None:
+        if is_command:
+            await process_commands_timed(message)
+        return
+    # Got it first? Claiming and the barn insert are one statement (see queries.capture_spawn)
+    spawn_id = live["spawn_id"]
+    mob_name = live["mob_name"]
+    is_golden = (random.randint(1, 20) == 1)
+    hostile = MOBS[mob_name]["hostile"]
     async with db_pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO accountinfo (discord_id,guild_id)
-            VALUES ($1,$2)
-            ON CONFLICT (discord_id,guild_id) DO NOTHING;
-            """,
-            message.author.id,guild_id
+        with metrics.timed("beenbag_message_stage_seconds", stage="capture"):
+            caught = await q.fetchrow(
+                conn, "capture_spawn",
+                spawn_id, message.author.id, guild_id, mob_name, is_golden, now, hostile
+            )
+        unindex_spawn(message.channel.id, spawn_id)
+        if caught is None:
+            # someone else claimed it first, or it expired in the meantime
+            return await process_commands_timed(message)
+
+        # 1) Placed in the barn, or sacrificed if it can't be
+        sac = False
+        if hostile:
+            sac = True
+            reward = await u.sucsac(message.channel,message.author,mob_name,is_golden,"because it can't be captured",conn)
+            note = f"this mob is not catchable so it was sacrificed for {reward} emeralds"
+        elif not caught["placed"]:
+            sac = True
+            reward = await u.sucsac(message.channel,message.author,mob_name,is_golden,"because the barn was too full",conn)
+            note = f"sacrificed for {reward} emeralds (barn is full)."
+        else:
+            note = f"placed in your barn ({caught['occ']+1}/{caught['size']})."
+
+    # look up rarity info
+    rarity = MOBS[mob_name]["rarity"]
+    rar_info = RARITIES[rarity]
+    color    = COLOR_MAP[rar_info["colour"]]
+    if not sac:
+        # build and send the embed
+        embed = discord.Embed(
+            title=f"🏆 {message.author.display_name} caught a {'✨ Golden ' if is_golden else ''} {RARITIES[rarity]['name']} {mob_name}!",
+            description=f"{note}",
+            color=color
         )
-        user_id = message.author.id
-        bucket = chat_xp_cd.get_bucket(message)
-        can_gain = bucket.update_rate_limit() is None
-        if can_gain:
-            await u.gain_exp(conn,bot,user_id,1,message)
-    # 0) Try to capture any active spawn in this channel
-    name = message.content.strip().lower().replace(" ", "")
-    now = datetime.utcnow()
-    async with db_pool.acquire() as conn:
-        # find the oldest not-yet-expired spawn in this channel
-        spawn = await conn.fetchrow(
-            """
-            SELECT spawn_id, mob_name
-              FROM active_spawns
-             WHERE channel_id = $1
-               AND expires_at > $2
-             ORDER BY spawn_time
-             LIMIT 1
-            """,
-            message.channel.id, now
+        embed.add_field(
+            name="Rarity",
+            value=rar_info["name"].title(),
+            inline=True
         )
-        if spawn and name == spawn["mob_name"].lower().replace(" ", ""):
-            # Got it first!
-            spawn_id = spawn["spawn_id"]
-            mob_name = spawn["mob_name"]
-            is_golden = (random.randint(1, 20) == 1)
-            sac = False
-            # 1) Add to the barn (or sacrifice if full)
-            #    First ensure the player/barn rows exist:
-            await u.ensure_player(conn,message.author.id,guild_id)
-            await conn.execute(
-                "INSERT INTO barn_upgrades (user_id,guild_id) VALUES ($1,$2) ON CONFLICT DO NOTHING;",
-                message.author.id,guild_id
-            )
-            # count current barn occupancy
-            occ = await conn.fetchval(
-                "SELECT COALESCE(SUM(count),0) FROM barn WHERE user_id = $1 AND guild_id = $2",
-                message.author.id,guild_id
-            )
-            size = await conn.fetchval(
-                "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-                message.author.id,guild_id
-            )
-                
-            if MOBS[mob_name]["hostile"]:
-                sac = True
-                reward = await u.sucsac(message.channel,message.author,mob_name,is_golden,"because it can't be captured",conn)
-                note = f"this mob is not catchable so it was sacrificed for {reward} emeralds"
-            elif occ >= size:
-                sac = True
-                reward = await u.sucsac(message.channel,message.author,mob_name,is_golden,"because the barn was too full",conn)
-                note = f"sacrificed for {reward} emeralds (barn is full)."
-                
-            else:
-
-                # insert into barn with the golden flag
-                await conn.execute(
-                    """
-                    INSERT INTO barn (user_id, guild_id, mob_name, is_golden, count)
-                    VALUES ($1, $4, $2, $3, 1)
-                    ON CONFLICT (user_id, mob_name, is_golden)
-                    DO UPDATE SET count = barn.count + 1
-                    """,
-                    message.author.id, mob_name, is_golden, guild_id
-                )
+        await outbound.send(message.channel, outbound.CRITICAL, embed=embed)
+    # skip further processing (so they don’t also run a command)
+    return
 
-                note = f"placed in your barn ({occ+1}/{size})."
-            # 2) Delete the spawn so no one else can catch it
-            await conn.execute(
-                "DELETE FROM active_spawns WHERE spawn_id = $1",
-                spawn_id
-            )
 
-            # look up rarity info
-            rarity = MOBS[mob_name]["rarity"]
-            rar_info = RARITIES[rarity]
-            color    = COLOR_MAP[rar_info["colour"]]
-            if not sac:
-                # build and send the embed
-                embed = discord.Embed(
-                    title=f"🏆 {message.author.display_name} caught a {'✨ Golden ' if is_golden else ''} {RARITIES[rarity]['name']} {mob_name}!",
-                    description=f"{note}",
-                    color=color
-                )
-                embed.add_field(
-                    name="Rarity",
-                    value=rar_info["name"].title(),
-                    inline=True
-                )
-                await message.channel.send(embed=embed)
-                # skip further processing (so they don’t also run a command)
-            return
-        
-    await bot.process_commands(message)
+class HashETagFileResponse(web.FileResponse):
+    """FileResponse carrying the content-hash ETag, so a file and a table row of the
+    same image validate alike; aiohttp would otherwise set one from mtime and size."""
+
+    def __init__(self, path, etag: str, **kwargs):
+        self._hash_etag = etag
+        super().__init__(path, **kwargs)
+
+    @property
+    def etag(self):
+        return web.FileResponse.etag.fget(self)
 
+    @etag.setter
+    def etag(self, value):
+        web.FileResponse.etag.fset(self, self._hash_etag)
 
 async def handle_get_image(request):
-    # URL style: /i/<uuid> or /i/<uuid>.png
+    # URL style: /i/<uuid> or /i/<uuid>.<suffix>  (HEAD is routed here too)
     raw = request.match_info.get("id", "")
-    media_id = raw.split(".", 1)[0]  # strip optional .png
+    media_id = raw.split(".", 1)[0]  # strip optional suffix
 
     try:
         uuid_obj = uuid.UUID(media_id)
     except Exception:
         return web.Response(status=404, text="not found")
 
-    async with db_pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT mime, bytes FROM media WHERE id = $1", uuid_obj)
-    if not row:
+    entry = await mediastore.lookup(db_pool, uuid_obj)
+    if entry is None:
         return web.Response(status=404, text="not found")
 
     headers = {
         "Cache-Control": "public, max-age=31536000, immutable",
-        "ETag": media_id,
-        "Content-Disposition": 'inline; filename="image.png"',
+        "Content-Disposition": f'inline; filename="image{mediastore.suffix_for(entry["mime"])}"',
+        "ETag": f'"{entry["etag"]}"',
     }
+    # 1) conditional request: the client's copy is current (images never change)
+    if_none_match = request.if_none_match
+    if if_none_match and any(t.value in (entry["etag"], "*") for t in if_none_match):
+        return web.Response(status=304, headers=headers)
+
+    if entry["path"] is not None:
+        # on disk: sent with sendfile, no copy through Python (aiohttp handles Range)
+        headers["Content-Type"] = entry["mime"]
+        return HashETagFileResponse(entry["path"], entry["etag"], headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+
+    # 2) single byte range; anything we can't parse gets the whole image
+    body = entry["body"]
+    try:
+        rng = request.http_range
+    except ValueError:
+        rng = slice(None)
+    if rng.start is not None or rng.stop is not None:
+        start, stop, _ = rng.indices(len(body))
+        if start >= stop:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return web.Response(status=416, headers=headers)
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{len(body)}"
+        return web.Response(status=206, body=body[start:stop], content_type=entry["mime"], headers=headers)
+
+    # 3) whole image (aiohttp leaves the body off for HEAD)
     return web.Response(
-        body=bytes(row["bytes"]),
-        content_type=row["mime"],
+        body=body,
+        content_type=entry["mime"],
         headers=headers
     )
 
@@ -477,37 +623,6 @@ def _bot_can_send(ctx, ch) -> bool:
     # Threads may need send_messages_in_threads
     return perms.view_channel and (getattr(perms, "send_messages_in_threads", False) or perms.send_messages)
 
-async def _array_add(conn, guild_id: int, column: str, value: int):
-    # safety: only allow expected columns
-    if column not in ("link_channel_ids", "game_channel_ids"):
-        raise ValueError("invalid column")
-    await conn.execute(
-        f"""
-        INSERT INTO guild_settings (guild_id, {column})
-        VALUES ($1, ARRAY[$2]::bigint[])
-        ON CONFLICT (guild_id) DO UPDATE
-        SET {column} = (
-          SELECT ARRAY(
-            SELECT DISTINCT e FROM unnest(coalesce(guild_settings.{column}, '{{}}'::bigint[]) || ARRAY[$2]::bigint[]) AS t(e)
-          )
-        )
-        """,
-        guild_id, value
-    )
-
-async def _array_remove(conn, guild_id: int, column: str, value: int):
-    if column not in ("link_channel_ids", "game_channel_ids"):
-        raise ValueError("invalid column")
-    await conn.execute(
-        f"""
-        INSERT INTO guild_settings (guild_id, {column})
-        VALUES ($1, '{{}}'::bigint[])
-        ON CONFLICT (guild_id) DO UPDATE
-        SET {column} = array_remove(coalesce(guild_settings.{column}, '{{}}'::bigint[]), $2)
-        """,
-        guild_id, value
-    )
-
 def parse_channel_ids_any(bot: commands.Bot, msg: discord.Message) -> list[int]:
     ids = set()
     for m in _CHANNEL_TOKEN_RE.finditer(msg.content):
@@ -529,7 +644,7 @@ def parse_one_channel_id_any(bot: commands.Bot, msg: discord.Message) -> int | N
 async def _array_add(conn, guild_id: int, column: str, value: int):
     if column not in ("link_channel_ids", "game_channel_ids", "react_channel_ids"):
         raise ValueError("invalid column")
-    await conn.execute(
+    ids = await conn.fetchval(
         f"""
         INSERT INTO guild_settings (guild_id, {column})
         VALUES ($1, ARRAY[$2]::bigint[])
@@ -539,22 +654,26 @@ async def _array_add(conn, guild_id: int, column: str, value: int):
             SELECT DISTINCT e FROM unnest(coalesce(guild_settings.{column}, '{{}}'::bigint[]) || ARRAY[$2]::bigint[]) AS t(e)
           )
         )
+        RETURNING {column}
         """,
         guild_id, value
     )
+    u.update_guild_settings(guild_id, **{column: ids})
 
 async def _array_remove(conn, guild_id: int, column: str, value: int):
     if column not in ("link_channel_ids", "game_channel_ids", "react_channel_ids"):
         raise ValueError("invalid column")
-    await conn.execute(
+    ids = await conn.fetchval(
         f"""
         INSERT INTO guild_settings (guild_id, {column})
         VALUES ($1, '{{}}'::bigint[])
         ON CONFLICT (guild_id) DO UPDATE
         SET {column} = array_remove(coalesce(guild_settings.{column}, '{{}}'::bigint[]), $2)
+        RETURNING {column}
         """,
         guild_id, value
     )
+    u.update_guild_settings(guild_id, **{column: ids})
 def _bot_can_react(ctx, ch) -> bool:
     me = ctx.guild.me
     if not me:
@@ -577,6 +696,7 @@ async def enablewelcome(ctx):
             """,
             ctx.guild.id
         )
+    u.update_guild_settings(ctx.guild.id, welcome_enabled=True)
     await ctx.send("✅ Welcome messages **enabled**. New members will be greeted in the announce channel (if set).")
 
 
@@ -594,6 +714,7 @@ async def disablewelcome(ctx):
             """,
             ctx.guild.id
         )
+    u.update_guild_settings(ctx.guild.id, welcome_enabled=False)
     await ctx.send("✅ Welcome messages **disabled** for this server.")
 
 
@@ -702,8 +823,16 @@ async def setup(ctx):
                 guild_id, ch_id
             )
 
-    # update cache immediately so it takes effect
+    # update caches immediately so it takes effect
     _prefix_cache[guild_id] = command_prefix
+    u.update_guild_settings(
+        guild_id,
+        announce_channel_id=announce_channel_id,
+        link_channel_ids=link_channel_ids,
+        react_channel_ids=react_channel_ids,
+        game_channel_ids=game_channel_ids,
+        log_channel_id=log_channel_id,
+    )
 
     await ctx.send(
         f"✅ Setup complete! Using prefix **`{command_prefix}`**\n"
@@ -787,6 +916,18 @@ async def spawnnow(ctx):
         await ctx.send(f"❌ spawn failed: `{type(e).__name__}: {e}`")
 
 
+@bot.command(name="reloadassets", aliases=["reloadsprites"])
+@commands.is_owner()
+async def reloadassets(ctx):
+    """Re-scan assets/mobs; only files whose mtime changed are decoded again."""
+    # listdir and decoding stay off the event loop
+    result = await asyncio.to_thread(render.build_mob_index, MOBS)
+    msg = f"✅ Indexed **{result['sprites']}** sprites ({result['changed']} reloaded)."
+    if result["missing"]:
+        msg += f"\n⚠️ No image for: {', '.join(result['missing'])}"
+    await ctx.send(msg[:2000])
+
+
 @bot.command(name="setlogs", aliases=["setlog", "logs"])
 @commands.has_permissions(administrator=True)
 async def setlogs(ctx, channel: discord.TextChannel | None = None):
@@ -818,6 +959,7 @@ async def setlogs(ctx, channel: discord.TextChannel | None = None):
             """,
             ctx.guild.id, target.id
         )
+    u.update_guild_settings(ctx.guild.id, log_channel_id=target.id)
 
     await ctx.send(f"✅ Log channel set to {target.mention}.")
 @setlogs.error
@@ -964,12 +1106,7 @@ async def removelinkchannel(ctx, *, channel_text: str | None = None):
 @bot.command(name="linkchannels", aliases=["listlinks"])
 @commands.has_permissions(administrator=True)
 async def linkchannels(ctx):
-    async with db_pool.acquire() as conn:
-        ids = await conn.fetchval(
-            "SELECT link_channel_ids FROM guild_settings WHERE guild_id=$1",
-            ctx.guild.id
-        )
-    ids = ids or []
+    ids = sorted(u.get_guild_settings(ctx.guild.id)["link_channel_ids"])
     if not ids:
         return await ctx.send("ℹ️ No link channels configured.")
     mentions = []
@@ -1015,12 +1152,7 @@ async def removegamechannel(ctx, *, channel_text: str | None = None):
 @bot.command(name="gamechannels", aliases=["listgames"])
 @commands.has_permissions(administrator=True)
 async def gamechannels(ctx):
-    async with db_pool.acquire() as conn:
-        ids = await conn.fetchval(
-            "SELECT game_channel_ids FROM guild_settings WHERE guild_id=$1",
-            ctx.guild.id
-        )
-    ids = ids or []
+    ids = sorted(u.get_guild_settings(ctx.guild.id)["game_channel_ids"])
     if not ids:
         return await ctx.send("ℹ️ No game channels configured. (If empty, game commands are allowed anywhere.)")
     mentions = []
@@ -1069,12 +1201,7 @@ async def removereactchannel(ctx, *, channel_text: str | None = None):
 @commands.has_permissions(administrator=True)
 async def reactchannels(ctx):
     """List configured react channels."""
-    async with db_pool.acquire() as conn:
-        ids = await conn.fetchval(
-            "SELECT react_channel_ids FROM guild_settings WHERE guild_id=$1",
-            ctx.guild.id
-        )
-    ids = ids or []
+    ids = sorted(u.get_guild_settings(ctx.guild.id)["react_channel_ids"])
     if not ids:
         return await ctx.send("ℹ️ No react channels configured.")
     mentions = []
@@ -1100,11 +1227,7 @@ async def only_in_game_channels(ctx: commands.Context):
     if ctx.author.guild_permissions.administrator:
         return True
 
-    async with db_pool.acquire() as conn:
-        ids = await conn.fetchval(
-            "SELECT game_channel_ids FROM guild_settings WHERE guild_id=$1",
-            ctx.guild.id
-        )
+    ids = u.get_guild_settings(ctx.guild.id)["game_channel_ids"]
 
     # If not configured or empty -> allow everywhere
     if not ids:
@@ -1133,24 +1256,15 @@ async def on_member_join(member: discord.Member):
     guild = member.guild
 
     # read setting (default TRUE) + preferred channel
-    async with db_pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """
-            SELECT COALESCE(welcome_enabled, TRUE) AS welcome_enabled,
-                   announce_channel_id
-            FROM guild_settings
-            WHERE guild_id = $1
-            """,
-            guild.id
-        )
+    settings = u.get_guild_settings(guild.id)
 
-    if row and not row["welcome_enabled"]:
+    if not settings["welcome_enabled"]:
         return  # welcomes disabled
 
     # pick channel: announce_channel_id → system_channel → first text channel we can speak in
     channel = None
-    if row and row["announce_channel_id"]:
-        channel = guild.get_channel(row["announce_channel_id"])
+    if settings["announce_channel_id"]:
+        channel = guild.get_channel(settings["announce_channel_id"])
         if channel and not channel.permissions_for(guild.me).send_messages:
             channel = None
     if channel is None:
@@ -1268,7 +1382,7 @@ _ADMIN_NAMES = {
     "addlinkchannel","addlink","removelinkchannel","removelink","dellink","linkchannels","listlinks",
     "addgamechannel","addgame","removegamechannel","removegame","delgame","gamechannels","listgames",
     "addreactchannel","addreact","removereactchannel","delreact","reactchannels","listreact",
-    "enablewelcome","welcomeon","disablewelcome","welcomeoff","setprefix","prefix","spawnnow"
+    "enablewelcome","welcomeon","disablewelcome","welcomeoff","setprefix","prefix","spawnnow","reloadassets"
 }
 
 async def _categorize_commands(ctx: commands.Context) -> Dict[str, List[commands.Command]]:
@@ -1696,77 +1810,107 @@ async def aquarium(ctx, *, who: str = None):
 
 
 
-def pixelate(img: Image.Image, size: int) -> Image.Image:
-    """Downscale to (size×size) then upscale back, nearest-neighbor."""
-    # shrink
-    small = img.resize((size, size), resample=Image.NEAREST)
-    # blow back up to original dims
-    return small.resize(img.size, Image.NEAREST)
+# ---------- live spawn index ----------
+# channel_id -> live spawns, oldest first. active_spawns stays the source of truth;
+# this only lets on_message skip the DB for messages that can't be a capture.
+_live_spawns = {}  # type: dict[int, list[dict]]
 
-def zoom_frame_at(src: Image.Image, zoom_frac: float, center: tuple[float,float]) -> Image.Image:
-    """
-    Crop src to a zoom_frac× window centered at `center` (fractions 0–1),
-    then scale back up to full size.
-    """
-    w, h = src.size
-    f = max(0.01, min(zoom_frac, 1.0))
-    cw, ch = int(w * f), int(h * f)
-
-    # compute top-left so the window is centered on (cx, cy)
-    cx, cy = center
-    left = int(cx * w - cw / 2)
-    top  = int(cy * h - ch / 2)
-    # clamp to image bounds
-    left = max(0, min(left, w - cw))
-    top  = max(0, min(top, h - ch))
-
-    crop = src.crop((left, top, left + cw, top + ch))
-    return crop.resize((w, h), Image.NEAREST)
-
-async def watch_spawn_expiry(spawn_id, channel_id, message_id, mob_name, expires_at):
-    # Sleep until the exact expiry time
-    now = datetime.utcnow()
-    delay = (expires_at - now).total_seconds()
-    if delay > 0:
-        await asyncio.sleep(delay)
-
-    # After sleeping, check if it's still uncaught
+def _norm_mob_name(name: str) -> str:
+    return name.strip().lower().replace(" ", "")
+
+def index_spawn(channel_id: int, spawn_id: int, mob_name: str, spawn_time: datetime, expires_at: datetime):
+    spawns = _live_spawns.setdefault(channel_id, [])
+    spawns.append({
+        "spawn_id": spawn_id,
+        "mob_name": mob_name,
+        "norm": _norm_mob_name(mob_name),
+        "spawn_time": spawn_time,
+        "expires_at": expires_at,
+    })
+    spawns.sort(key=lambda s: s["spawn_time"])
+
+def unindex_spawn(channel_id: int, spawn_id: int):
+    spawns = _live_spawns.get(channel_id)
+    if not spawns:
+        return
+    spawns[:] = [s for s in spawns if s["spawn_id"] != spawn_id]
+    if not spawns:
+        del _live_spawns[channel_id]
+
+def match_live_spawn(channel_id: int, name: str, now: datetime) -> dict | None:
+    """Return the channel's oldest live spawn if `name` (already normalised) is its mob, else None."""
+    spawns = _live_spawns.get(channel_id)
+    if not spawns:
+        return None
+    if spawns[0]["expires_at"] <= now:
+        # expired entries are dropped here; sweep_expired_spawns deals with the DB row
+        spawns[:] = [s for s in spawns if s["expires_at"] > now]
+        if not spawns:
+            del _live_spawns[channel_id]
+            return None
+    oldest = spawns[0]
+    return oldest if name == oldest["norm"] else None
+
+async def rebuild_spawn_index():
+    """Reload the index from active_spawns (e.g. after a restart)."""
     async with db_pool.acquire() as conn:
-        still_there = await conn.fetchval(
-            "SELECT 1 FROM active_spawns WHERE spawn_id = $1", spawn_id
-        )
-        if not still_there:
-            return  # someone caught it already
+        rows = await q.fetch(conn, "live_spawns", datetime.utcnow())
+    _live_spawns.clear()
+    for r in rows:
+        index_spawn(r["channel_id"], r["spawn_id"], r["mob_name"], r["spawn_time"], r["expires_at"])
+    logging.info(f"[spawns] indexed {len(rows)} live spawns")
 
-        # Remove the DB entry
-        await conn.execute(
-            "DELETE FROM active_spawns WHERE spawn_id = $1", spawn_id
-        )
+# ---------- spawn expiry sweeper ----------
+SPAWN_SWEEP_SECONDS = 5
 
-    # Try to delete the original image message
-    channel = bot.get_channel(channel_id)
-    if channel:
-        try:
-            orig = await channel.fetch_message(message_id)
-            await orig.delete()
-        except discord.NotFound:
-            pass
+async def sweep_expired_spawns():
+    """Delete every expired spawn in one statement, then clean up its message and announce the escape.
+
+    Rows that expired while the bot was down are picked up by the first sweep after startup.
+    """
+    async with db_pool.acquire() as conn:
+        rows = await q.fetch(conn, "sweep_expired_spawns", datetime.utcnow())
+    if not rows:
+        return
+    logging.info(f"[spawns] sweeping {len(rows)} expired spawns")
+    await asyncio.gather(*(announce_escape(r) for r in rows), return_exceptions=True)
+
+async def announce_escape(row):
+    unindex_spawn(row["channel_id"], row["spawn_id"])
+    spawn_scheduler.cancel(("reveal", row["message_id"]))
+    channel = bot.get_channel(row["channel_id"])
+    if not channel:
+        return
+    # Delete the original image message; a partial message needs no fetch
+    try:
+        await channel.get_partial_message(row["message_id"]).delete()
+    except discord.HTTPException:
+        pass  # already gone, or we lost permission
 
-        # Announce the escape
-        await channel.send(f"**{mob_name}** escaped, maybe next time")
+    # Announce the escape
+    outbound.send(channel, outbound.NORMAL, content=f"**{row['mob_name']}** escaped, maybe next time")
 
+async def spawn_sweep_tick():
+    try:
+        await sweep_expired_spawns()
+    finally:
+        spawn_scheduler.call_later(SPAWN_SWEEP_SECONDS, "sweep_expired_spawns", spawn_sweep_tick)
 
-# store per-guild tasks here
-if not hasattr(bot, "_guild_spawn_tasks"):
-    bot._guild_spawn_tasks = {}
+
+# ---------- spawn scheduling ----------
+# One scheduler owns every guild's next spawn, each spawn's reveal frames and the expiry sweep.
+# Keys: ("spawn", guild_id), ("reveal", message_id), and "sweep_expired_spawns"
+spawn_scheduler = Scheduler(max_concurrency=int(os.getenv("SPAWN_CONCURRENCY", 32)))
+# guilds whose spawn tick should keep rescheduling itself
+_spawn_guilds = set()  # type: set[int]
+REVEAL_STEP_SECONDS = 15
+# at startup, spread the first spawn of every guild over this many seconds
+SPAWN_STARTUP_SPREAD = 120
 
 async def get_spawn_channels_for_guild(guild_id: int):
     """Return a list of channels in this guild where we can spawn."""
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT channel_id FROM guild_spawn_channels WHERE guild_id = $1",
-            guild_id
-        )
+        rows = await q.fetch(conn, "spawn_channels", guild_id)
     chans = []
     for r in rows:
         ch = bot.get_channel(r["channel_id"])
@@ -1791,16 +1935,9 @@ async def spawn_once_in_channel(chan):
     weights   = [(2 ** (max_r + 1 - r)) for r in rarities]
 
     mob = random.choices(mob_names, weights=weights, k=1)[0]
-    mob_path = f"assets/mobs/{mob}"
-    try:
-        if os.path.isdir(mob_path):
-            imgs = [f for f in os.listdir(mob_path) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
-            if not imgs:
-                raise FileNotFoundError("No image files in directory")
-            src = Image.open(os.path.join(mob_path, random.choice(imgs))).convert("RGBA")
-        else:
-            src = Image.open(f"{mob_path}.png").convert("RGBA")
-    except FileNotFoundError:
+    # sprites come from the startup asset index; no filesystem access here
+    asset = render.pick_sprite(mob)
+    if asset is None:
         # still send an embed so UX is consistent
         pref = get_cached_prefix(chan.guild.id if chan.guild else None)
         e = discord.Embed(
@@ -1809,51 +1946,17 @@ async def spawn_once_in_channel(chan):
             color=discord.Color.blurple()
         )
         e.set_footer(text=f"For attribution & licensing, use {pref}credits")
-        await chan.send(embed=e)
+        await outbound.send(chan, outbound.CRITICAL, embed=e)
         return
 
-    # ---- choose a focal point (same as before) ----
-    alpha = src.split()[-1]
-    bbox  = alpha.getbbox()
-    if bbox:
-        left, top, right, bottom = bbox
-        found = False
-        for _ in range(500):
-            x = random.randint(left, right - 1)
-            y = random.randint(top,  bottom - 1)
-            if alpha.getpixel((x, y)) > 0:
-                found = True
-                break
-        if not found:
-            x = (left + right) // 2
-            y = (top + bottom) // 2
-        w, h = src.size
-        center = (x / w, y / h)
-    else:
-        center = (random.uniform(0.1, 0.9), random.uniform(0.1, 0.9))
-
-    # ---- frame creators (unchanged) ----
-    def pixelate(img: Image.Image, size: int) -> Image.Image:
-        small = img.resize((size, size), resample=Image.NEAREST)
-        return small.resize(img.size, Image.NEAREST)
-
-    def zoom_frame_at(src: Image.Image, zoom_frac: float, center_xy: tuple[float, float]) -> Image.Image:
-        w, h = src.size
-        f  = max(0.01, min(zoom_frac, 1.0))
-        cw = int(w * f); ch = int(h * f)
-        cx, cy = center_xy
-        left = int(cx * w - cw / 2)
-        top  = int(cy * h - ch / 2)
-        left = max(0, min(left, w - cw))
-        top  = max(0, min(top,  h - ch))
-        crop = src.crop((left, top, left + cw, top + ch))
-        return crop.resize((w, h), Image.NEAREST)
+    # ---- choose a focal point: any opaque pixel, precomputed per sprite ----
+    focal = render.pick_focal(asset)
 
+    # ---- frames come from the render cache as ready-to-send PNG bytes ----
     pix = (random.randint(1, 4) == 1)
-    frame_sizes = [1, 2, 4, 8, 16, src.size[0]]
-    zoom_levels = [0.01, 0.05, 0.1, 0.2, 0.4, 1.0]
-    levels     = frame_sizes if pix else zoom_levels
-    make_frame = (lambda lvl: pixelate(src, lvl)) if pix else (lambda lvl: zoom_frame_at(src, lvl, center))
+    levels     = render.PIXEL_LEVELS if pix else render.ZOOM_LEVELS
+    mode       = "pixel" if pix else "zoom"
+    make_frame = lambda lvl: render.spawn_frame(asset, mode, lvl, focal)  # coroutine
 
     # ---- build the embed once; image will be provided via attachment ----
     pref = get_cached_prefix(chan.guild.id if chan.guild else None)
@@ -1867,87 +1970,71 @@ async def spawn_once_in_channel(chan):
     embed.set_footer(text=f"For attribution & licensing, use {pref}credits")
 
     # first frame
-    buf = io.BytesIO()
-    make_frame(levels[0]).save(buf, format="PNG")
-    buf.seek(0)
-    msg = await chan.send(
+    msg = await outbound.send(
+        chan, outbound.CRITICAL,
         embed=embed,
-        file=discord.File(buf, "spawn.png")
+        file=discord.File(io.BytesIO(await make_frame(levels[0])), "spawn.png")
     )
 
     # DB insert & expiry
     stay_seconds = RARITIES[MOBS[mob]["rarity"]]["stay"]
-    expires = datetime.utcnow() + timedelta(seconds=stay_seconds)
+    spawned_at = datetime.utcnow()
+    expires = spawned_at + timedelta(seconds=stay_seconds)
 
     async with db_pool.acquire() as conn:
-        rec = await conn.fetchrow(
-            """
-            INSERT INTO active_spawns
-                (guild_id, channel_id, mob_name, message_id, revealed, spawn_time, expires_at)
-            VALUES ($1,$2,$3,$4,0,$5,$6)
-            RETURNING spawn_id
-            """,
-            chan.guild.id, chan.id, mob, msg.id, datetime.utcnow(), expires
-        )
+        rec = await q.fetchrow(conn, "add_spawn", chan.guild.id, chan.id, mob, msg.id, spawned_at, expires)
+    index_spawn(chan.id, rec["spawn_id"], mob, spawned_at, expires)
 
     # subsequent frames: replace the attachment, keep the same embed (it still points to attachment://spawn.png)
-    for lvl in levels[1:]:
-        await asyncio.sleep(15)
-        buf = io.BytesIO()
-        make_frame(lvl).save(buf, format="PNG")
-        buf.seek(0)
-        await msg.edit(
-            embed=embed,
-            attachments=[discord.File(buf, "spawn.png")]
-        )
-
-    # schedule expiry watcher
-    bot.loop.create_task(
-        watch_spawn_expiry(
-            spawn_id=rec["spawn_id"],
-            channel_id=chan.id,
-            message_id=msg.id,
-            mob_name=mob,
-            expires_at=expires
-        )
+    # (expiry is handled by sweep_expired_spawns)
+    spawn_scheduler.call_later(REVEAL_STEP_SECONDS, ("reveal", msg.id), reveal_spawn_frame, msg, embed, make_frame, levels[1:])
+
+async def reveal_spawn_frame(msg: discord.Message, embed: discord.Embed, make_frame, levels: list, prev: asyncio.Future | None = None):
+    """Queue the next reveal frame, then schedule the one after it."""
+    if prev is not None and prev.done() and not prev.cancelled() and isinstance(prev.exception(), discord.NotFound):
+        return  # the spawn message is gone (expired or deleted)
+    sent = outbound.edit(
+        msg, outbound.COSMETIC,
+        embed=embed,
+        attachments=[discord.File(io.BytesIO(await make_frame(levels[0])), "spawn.png")]
     )
+    if len(levels) > 1:
+        spawn_scheduler.call_later(REVEAL_STEP_SECONDS, ("reveal", msg.id), reveal_spawn_frame, msg, embed, make_frame, levels[1:], sent)
 
-async def spawn_loop_for_guild(guild_id: int):
-    await bot.wait_until_ready()
-    while True:
-        try:
-            channels = await get_spawn_channels_for_guild(guild_id)
-            if not channels:
-                logging.info(f"[spawns] guild {guild_id}: no valid spawn channels")
-            else:
-                chan = random.choice(channels)
-                logging.info(f"[spawns] guild {guild_id}: spawning in #{chan} ({chan.id})")
-                await spawn_once_in_channel(chan)
-
-            # sleep AFTER the attempt
-            await asyncio.sleep(random.randint(120, 480))
-
-        except asyncio.CancelledError:
-            break
-        except Exception:
-            logging.exception(f"[spawns] loop error for guild {guild_id}; backing off 10s")
-            await asyncio.sleep(10)
+async def spawn_tick(guild_id: int):
+    """Spawn once in a random channel of this guild, then schedule the guild's next spawn."""
+    # the old per-guild loop waited out the whole reveal before sleeping; keep that cadence
+    delay = random.randint(120, 480) + REVEAL_STEP_SECONDS * 5
+    try:
+        channels = await get_spawn_channels_for_guild(guild_id)
+        if not channels:
+            logging.info(f"[spawns] guild {guild_id}: no valid spawn channels")
+        else:
+            chan = random.choice(channels)
+            logging.info(f"[spawns] guild {guild_id}: spawning in #{chan} ({chan.id})")
+            await spawn_once_in_channel(chan)
+    except Exception:
+        logging.exception(f"[spawns] tick error for guild {guild_id}; backing off 10s")
+        delay = 10
+    if guild_id in _spawn_guilds:
+        spawn_scheduler.call_later(delay, ("spawn", guild_id), spawn_tick, guild_id)
 
 
-def start_guild_spawn_task(guild_id: int):
-    stop_guild_spawn_task(guild_id)
-    logging.info(f"[spawns] starting loop for guild {guild_id}")
-    bot._guild_spawn_tasks[guild_id] = asyncio.create_task(spawn_loop_for_guild(guild_id))
+def start_guild_spawn_task(guild_id: int, delay: float = 0):
+    """(Re)start this guild's spawns; the first one fires after `delay` seconds."""
+    logging.info(f"[spawns] scheduling spawns for guild {guild_id}")
+    _spawn_guilds.add(guild_id)
+    spawn_scheduler.call_later(delay, ("spawn", guild_id), spawn_tick, guild_id)
 
 
 def stop_guild_spawn_task(guild_id: int):
-    t = bot._guild_spawn_tasks.pop(guild_id, None)
-    if t and not t.done():
-        t.cancel()
+    _spawn_guilds.discard(guild_id)
+    spawn_scheduler.cancel(("spawn", guild_id))
 
 def start_all_guild_spawn_tasks():
+    # spread the first spawns out so a restart doesn't hit every guild at once
     for g in bot.guilds:
-        start_guild_spawn_task(g.id)
+        start_guild_spawn_task(g.id, delay=random.uniform(0, SPAWN_STARTUP_SPREAD))
 
 
 
@@ -1955,6 +2042,7 @@ async def start_http_server():
     app = web.Application()
     app.router.add_get("/i/{id}", handle_get_image)
     app.router.add_get("/", handle_ping)
+    app.router.add_get("/metrics", handle_metrics)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
@@ -1967,6 +2055,9 @@ async def start_http_server():
 async def main():
     # 1) Init Postgres
     await init_db()
+    render.build_mob_index(MOBS)
+    if os.getenv("SPAWN_FRAME_WARMUP"):
+        await render.warm_spawn_frames()
 
     # 2) Start HTTP server and keep a reference to the runner for cleanup
     runner = await start_http_server()
@@ -1,13 +1,12 @@
-import os
 import asyncio
 import logging
 import random
+import time
 import discord
 from discord.ext import commands
 import asyncpg
 from aiohttp import web
 from PIL import Image, ImageOps
-import io
 import dateparser
 
 from datetime import datetime,timedelta
@@ -17,6 +16,10 @@ import secrets
 from stronghold import PathButtons
 from constants import *
 from utils import *
+import queries as q
+import outbound
+import render
+import mediastore
 import aiohttp
 
 async def upload_to_catbox(image_bytes: bytes, filename: str = "image.png") -> str:
@@ -104,14 +107,9 @@ async def c_linkyt(ctx, channel_name: str):
         await ctx.send(
             f"{ctx.author.mention}, I couldn’t DM you right now—please try again later. Make sure to enable DMs from server members and try again (Content and social -> Social Permissions -> Direct Messages) You can turn it back off after."
         )
-async def get_link_channel_ids(guild_id: int) -> list[int]:
+def get_link_channel_ids(guild_id: int) -> list[int]:
     """Return configured link channels for this guild or []."""
-    async with db_pool.acquire() as conn:
-        ids = await conn.fetchval(
-            "SELECT link_channel_ids FROM guild_settings WHERE guild_id = $1",
-            guild_id
-        )
-    return ids or []
+    return sorted(get_guild_settings(guild_id)["link_channel_ids"])
 async def c_yt(ctx, who = None):
     """
     Show the YouTube channel linked to a user.
@@ -130,7 +128,7 @@ async def c_yt(ctx, who = None):
             return await ctx.send("Member not found.")  # or "Member not found."
     user_id = member.id
     # 0) Restrict to link channels (if any configured)
-    link_ids = await get_link_channel_ids(ctx.guild.id)
+    link_ids = get_link_channel_ids(ctx.guild.id)
     if link_ids and ctx.channel.id not in link_ids:
         # build nice mentions for configured channels that still exist
         mentions = [f"<#{cid}>" for cid in link_ids if ctx.guild.get_channel(cid)]
@@ -192,62 +190,26 @@ async def c_give(ctx, who: str, mob: str):
 
     async with db_pool.acquire() as conn:
         # Target barn capacity + current fill (per guild)
-        row = await conn.fetchrow(
-            "SELECT barn_size FROM new_players WHERE guild_id=$1 AND user_id=$2",
-            g, target_id
-        )
+        row = await q.fetchrow(conn, "barn_size", target_id, g)
         target_size = row["barn_size"] if row else 5
 
-        total_in_barn = await conn.fetchval(
-            "SELECT COALESCE(SUM(count), 0) FROM barn WHERE guild_id=$1 AND user_id=$2",
-            g, target_id
-        )
+        total_in_barn = await q.fetchval(conn, "barn_occupancy", target_id, g)
 
         # Take one mob from giver (prefer non-golden)
-        rec = await conn.fetchrow(
-            """
-            SELECT is_golden, count
-              FROM barn
-             WHERE guild_id=$1 AND user_id=$2 AND mob_name=$3
-             ORDER BY is_golden ASC
-             LIMIT 1
-            """,
-            g, giver_id, mob_name
-        )
+        rec = await q.fetchrow(conn, "mob_to_give", giver_id, g, mob_name)
         if not rec:
             return await ctx.send(f"❌ You have no **{mob_name}** to give.")
         is_golden = rec["is_golden"]
         have      = rec["count"]
 
         if have > 1:
-            await conn.execute(
-                """
-                UPDATE barn
-                   SET count = count - 1
-                 WHERE guild_id=$1 AND user_id=$2 AND mob_name=$3 AND is_golden=$4
-                """,
-                g, giver_id, mob_name, is_golden
-            )
+            await q.execute(conn, "take_mob", giver_id, g, mob_name, is_golden)
         else:
-            await conn.execute(
-                """
-                DELETE FROM barn
-                 WHERE guild_id=$1 AND user_id=$2 AND mob_name=$3 AND is_golden=$4
-                """,
-                g, giver_id, mob_name, is_golden
-            )
+            await q.execute(conn, "remove_mob", giver_id, g, mob_name, is_golden)
 
         # If recipient has room, transfer it
         if total_in_barn < target_size:
-            await conn.execute(
-                """
-                INSERT INTO barn (guild_id, user_id, mob_name, is_golden, count)
-                VALUES ($1, $2, $3, $4, 1)
-                ON CONFLICT (guild_id, user_id, mob_name, is_golden)
-                DO UPDATE SET count = barn.count + 1
-                """,
-                g, target_id, mob_name, is_golden
-            )
+            await q.execute(conn, "receive_mob", target_id, g, mob_name, is_golden)
             return await ctx.send(
                 f"✅ You gave {'✨ ' if is_golden else ''}**{mob_name}** to {member.mention}!"
             )
@@ -331,12 +293,12 @@ async def c_craft(ctx, args):
         tier = "diamond"
         async with db_pool.acquire() as conn:
             await ensure_player(conn,ctx.author.id,guild_id)
-            # Fetch their resources
-            ore_have = await get_items(conn, user_id, "diamond",guild_id)
-            if ore_have < cost:
+            # Pay first: the take fails cleanly if they don't have enough
+            try:
+                await take_items(user_id, "diamond", cost, conn, guild_id)
+            except ValueError:
                 return await ctx.send(f"❌ You need {cost} diamonds to craft that.")
             await give_items(user_id,"totem", 1, "items", False, conn,guild_id)
-            await take_items(user_id, "diamond", cost, conn, guild_id)
         return await ctx.send(f"🔨 You crafted a **totem**, you will now be get an extra life in a stronghold. You can only use one per run.")
 
     if tier is None:
@@ -351,32 +313,26 @@ async def c_craft(ctx, args):
     async with db_pool.acquire() as conn:
         await ensure_player(conn,ctx.author.id,guild_id)
         # Fetch their resources
-        row = await conn.fetchrow("""SELECT
-                MAX(CASE WHEN item_name = 'wood' THEN quantity ELSE 0 END) AS wood,
-                MAX(CASE WHEN item_name = $2 THEN quantity ELSE 0 END) AS ore_have
-                FROM player_items
-                WHERE player_id = $1 AND guild_id = $3 AND item_name IN ('wood', $2);""",
-                user_id,ore_col,guild_id)
+        row = await q.fetchrow(conn, "craft_resources", user_id, guild_id, ore_col)
         wood_have, ore_have = row["wood"], row["ore_have"]
 
+        need = [f"**{wood_cost} wood**"]
+        if ore_col:
+            need.append(f"**{ore_cost} {ore_col}**")
         if wood_have < wood_cost or ore_have < ore_cost:
-            need = [f"**{wood_cost} wood**"]
-            if ore_col:
-                need.append(f"**{ore_cost} {ore_col}**")
             return await ctx.send(f"❌ You need { ' and '.join(need) } to craft that.")
 
-        # Deduct resources
-        await take_items(user_id,"wood",wood_cost,conn,guild_id)
-        if ore_col:
-            await take_items(user_id,ore_col,ore_cost,conn,guild_id)
+        # Deduct resources and give the tool together, so a failed take refunds the other
+        try:
+            async with conn.transaction():
+                await take_items(user_id,"wood",wood_cost,conn,guild_id)
+                if ore_col:
+                    await take_items(user_id,ore_col,ore_cost,conn,guild_id)
 
-        # Give the tool
-        await conn.execute("""
-            INSERT INTO tools (user_id, guild_id, tool_name, tier, uses_left)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (user_id, guild_id, tool_name, tier) DO UPDATE
-              SET uses_left = tools.uses_left + EXCLUDED.uses_left;
-        """, user_id, guild_id, tool, tier, uses)
+                # Give the tool
+                await q.execute(conn, "give_tool", user_id, guild_id, tool, tier, uses)
+        except ValueError:
+            return await ctx.send(f"❌ You don’t have { ' and '.join(need) } any more.")
 
     await ctx.send(f"🔨 You crafted a **{tier.title()} {tool.replace('_',' ').title()}** with {uses} uses!")
 def _norm(s: str) -> str:
@@ -384,11 +340,7 @@ def _norm(s: str) -> str:
 async def c_shop(ctx):
     """List all items you can buy in the shop."""
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT item_id, name, description, price_emeralds, purchase_limit
-              FROM shop_items
-             ORDER BY item_id
-        """)
+        rows = await q.fetch(conn, "shop_items")
     embed = discord.Embed(title="🏪 Shop", color=discord.Color.gold())
     for r in rows:
         limit = "unlimited" if r["purchase_limit"] is None else str(r["purchase_limit"])
@@ -424,35 +376,25 @@ async def c_breed(ctx, mob: str):
             )
 
         # 3) Check barn count for that mob (non-golden)
-        have = await conn.fetchval(
-            """
-            SELECT count
-              FROM barn
-             WHERE user_id=$1 AND guild_id = $2 AND mob_name=$3 AND is_golden=false
-            """,
-            user_id, guild_id, key
-        ) or 0
+        have = await q.fetchval(conn, "mob_count", user_id, guild_id, key) or 0
         if have < 2:
             return await ctx.send(
                 f"❌ You need at least **2** **{key}** in your barn to breed, but only have **{have}**."
             )
 
         # 4) Check barn space
-        occupancy = await conn.fetchval(
-            "SELECT COALESCE(SUM(count), 0) FROM barn WHERE user_id = $1 AND guild_id = $2",
-            user_id,guild_id
-        )
-        barn_size = await conn.fetchval(
-            "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-            user_id,guild_id
-        )
+        occupancy = await q.fetchval(conn, "barn_occupancy", user_id, guild_id)
+        barn_size = await q.fetchval(conn, "barn_size", user_id, guild_id)
         if occupancy >= barn_size:
             return await ctx.send(
                 f"❌ Your barn is full (**{occupancy}/{barn_size}**). Upgrade it before breeding more mobs!"
             )
 
         # 5) Deduct wheat and breed
-        await take_items(user_id, "wheat", wheat, conn,guild_id)
+        try:
+            await take_items(user_id, "wheat", wheat, conn, guild_id)
+        except ValueError:
+            return await ctx.send(f"❌ You don’t have **{wheat} wheat** any more.")
         new_count = await give_mob(conn, user_id, key,guild_id)
 
     # 6) Success
@@ -469,17 +411,7 @@ async def c_farm(ctx):
         await ensure_player(conn,ctx.author.id,guild_id)
 
         # 1) Fetch all usable pickaxes
-        pickaxes = await conn.fetch(
-            """
-            SELECT tier, uses_left
-              FROM tools
-             WHERE user_id = $1
-               AND guild_id = $2
-               AND tool_name = 'hoe'
-               AND uses_left > 0
-            """,
-            user_id, guild_id
-        )
+        pickaxes = await q.fetch(conn, "usable_tools", user_id, guild_id, "hoe")
         # 2) Determine your highest tier hoe
         owned_tiers = {r["tier"] for r in pickaxes}
         best_tier = None
@@ -490,18 +422,7 @@ async def c_farm(ctx):
 
         # 3) Consume 1 use on that hoe
         if best_tier:
-            await conn.execute(
-                """
-                UPDATE tools
-                SET uses_left = uses_left - 1
-                WHERE user_id = $1
-                AND guild_id = $2
-                AND tool_name = 'hoe'
-                AND tier = $3
-                AND uses_left > 0
-                """,
-                user_id, guild_id, best_tier
-            )
+            await q.execute(conn, "use_tool", user_id, guild_id, "hoe", best_tier)
 
         # 4) Pick a drop according to your tier’s table
         avg = WHEAT_DROP[best_tier]
@@ -532,14 +453,15 @@ async def c_farm(ctx):
         "⛏️ farming... [🌿🌿🌿🌿⛏️]",
         "⛏️ farming... [🌿🌿🌿🌿🌿]",
     ]
-    msg = await ctx.send(f"{ctx.author.mention} {frames[0]}")
+    msg = await outbound.send(ctx.channel, outbound.NORMAL, content=f"{ctx.author.mention} {frames[0]}")
     for frame in frames[1:]:
         await asyncio.sleep(0.5)
-        await msg.edit(content=f"{ctx.author.mention} {frame}")
+        # cosmetic; if the channel is busy, queued frames are replaced by newer ones
+        outbound.edit(msg, outbound.COSMETIC, content=f"{ctx.author.mention} {frame}")
 
     # --- 3) Show the result ---
     await asyncio.sleep(0.5)
-    await msg.edit(content=result)
+    await outbound.edit(msg, outbound.NORMAL, content=result)
 
 
 async def c_buy(ctx, args):
@@ -579,14 +501,7 @@ async def c_buy(ctx, args):
     guild_id = gid_from_ctx(ctx)
     async with db_pool.acquire() as conn:
         # 2) Look up the item
-        item = await conn.fetchrow(
-            """
-            SELECT item_id, name, price_emeralds, purchase_limit
-              FROM shop_items
-             WHERE LOWER(name) = $1
-            """,
-            lookup_name
-        )
+        item = await q.fetchrow(conn, "shop_item", lookup_name)
         if not item:
             return await ctx.send(f"❌ No shop item named **{raw_name}**.")
 
@@ -608,37 +523,23 @@ async def c_buy(ctx, args):
         # 4) Enforce daily limit (for Exp Bottle only, or any limited item)
         if limit is not None:
             since = datetime.utcnow() - timedelta(hours=24)
-            bought = await conn.fetchval(
-                """
-                SELECT COUNT(*) FROM purchase_history
-                 WHERE user_id = $1
-                   AND guild_id = $4
-                   AND item_id = $2
-                   AND purchased_at > $3
-                """,
-                user_id, item_id, since, guild_id
-            )
+            bought = await q.fetchval(conn, "purchases_since", user_id, guild_id, item_id, since)
             if bought + qty > limit:
                 return await ctx.send(
                     f"❌ You can only buy {limit}/{limit} **{display_name}** per 24 h."
                 )
 
         # 5) Deduct emeralds
-        await take_items(user_id,"emeralds",total_cost,conn,guild_id)
+        try:
+            await take_items(user_id, "emeralds", total_cost, conn, guild_id)
+        except ValueError:
+            return await ctx.send(f"❌ You don’t have {total_cost} 💠 any more.")
 
         # 6) Log each purchase for history
         for _ in range(qty):
-            await conn.execute(
-                "INSERT INTO purchase_history (user_id, item_id, guild_id) VALUES ($1,$2,$3)",
-                user_id, item_id, guild_id
-            )
+            await q.execute(conn, "record_purchase", user_id, guild_id, item_id)
         # 7) Update your cumulative purchases (e.g. boss tickets)
-        await conn.execute("""
-            INSERT INTO shop_purchases (user_id,item_id,quantity,guild_id)
-            VALUES ($1,$2,$3,$4)
-            ON CONFLICT (user_id,item_id,guild_id) DO UPDATE
-              SET quantity = shop_purchases.quantity + $3
-        """, user_id, item_id, qty,guild_id)
+        await q.execute(conn, "add_shop_purchase", user_id, guild_id, item_id, qty)
 
     # 8) Grant the effect
     async with db_pool.acquire() as conn:
@@ -832,15 +733,9 @@ async def c_givemob(ctx, who, mob_name: str, count: int = 1):
     
     async with db_pool.acquire() as conn:
         # 2) Fetch target’s barn capacity and current fill
-        row = await conn.fetchrow(
-            "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-            member.id, guild_id
-        )
+        row = await q.fetchrow(conn, "barn_size", member.id, guild_id)
         target_size = row["barn_size"] if row else 5
-        total_in_barn = await conn.fetchval(
-            "SELECT COALESCE(SUM(count), 0) FROM barn WHERE user_id = $1 AND guild_id = $2",
-            member.id, guild_id
-        )
+        total_in_barn = await q.fetchval(conn, "barn_occupancy", member.id, guild_id)
         if MOBS[mob_name.title()]["hostile"]:
             await sucsac(ctx,member,mob_name,False,"Because it cannot be captured",conn)
             return await ctx.send(f"✅ Sacrificed {mob_name} because it is hostile")
@@ -871,12 +766,11 @@ async def c_sac(ctx, mob_name: str):
     # Check for special @beennn sacrifice case
     if mob_name.lower() in ("@beeeenjaminnn", "<@674671907626287151>", "been","beenn"):  # replace with their real user ID
         async with db_pool.acquire() as conn:
-            diamond_count = await get_items(conn, user_id, "diamond",guild_id)
-            if diamond_count == 0:
-                return await ctx.send("💎 You don’t even have a diamond to take **L**.")
-            
             # Remove one diamond
-            await take_items(user_id, "diamond", 1, conn,guild_id)
+            try:
+                await take_items(user_id, "diamond", 1, conn,guild_id)
+            except ValueError:
+                return await ctx.send("💎 You don’t even have a diamond to take **L**.")
             await ctx.send(f"💀 You were a fool to think you could sacrifice Beenn, he beat you in combat and took a diamond.")
             return
     # validate mob
@@ -887,31 +781,16 @@ async def c_sac(ctx, mob_name: str):
     reward  = rar_info["emeralds"]
     async with db_pool.acquire() as conn:
         # check barn
-        rec = await conn.fetchrow(
-            """
-            SELECT count, is_golden
-              FROM barn
-             WHERE user_id=$1 AND mob_name=$2 AND guild_id = $3
-             ORDER BY is_golden DESC
-             LIMIT 1
-            """,
-            user_id, key, guild_id
-        )
+        rec = await q.fetchrow(conn, "mob_to_sacrifice", user_id, guild_id, key)
 
         if not rec:
             return await ctx.send(f"❌ You have no **{key}** to sacrifice.")
         have     = rec["count"]
         is_gold  = rec["is_golden"]
         if have > 1:
-            await conn.execute(
-                "UPDATE barn SET count = count - 1 WHERE user_id=$1 AND guild_id = $2 AND mob_name=$3",
-                user_id, guild_id, key
-            )
+            await q.execute(conn, "sacrifice_mob", user_id, guild_id, key)
         else:
-            await conn.execute(
-                "DELETE FROM barn WHERE user_id=$1 AND guild_id = $2 AND mob_name = $3",
-                user_id, guild_id, key
-            )
+            await q.execute(conn, "sacrifice_last_mob", user_id, guild_id, key)
         await sucsac(ctx,ctx.author,mob_name,is_gold,"",conn)
 
 async def c_bestiary(ctx, who: str = None):
@@ -978,17 +857,7 @@ async def c_chop(ctx):
     async with db_pool.acquire() as conn:
         await ensure_player(conn,ctx.author.id,guild_id)
         # 1) Fetch all usable pickaxes
-        axes = await conn.fetch(
-            """
-            SELECT tier, uses_left
-              FROM tools
-             WHERE user_id = $1
-             AND guild_id = $2
-               AND tool_name = 'axe'
-               AND uses_left > 0
-            """,
-            user_id, guild_id
-        )
+        axes = await q.fetch(conn, "usable_tools", user_id, guild_id, "axe")
         owned_tiers = {r["tier"] for r in axes}
         best_tier = None
         for tier in reversed(TIER_ORDER):
@@ -999,18 +868,7 @@ async def c_chop(ctx):
         num = AXEWOOD[best_tier]
         # grant 1 wood
         await give_items(user_id,"wood",num,"resource",False,conn,guild_id)
-        await conn.execute(
-            """
-            UPDATE tools
-               SET uses_left = uses_left - 1
-             WHERE user_id = $1
-             AND guild_id = $2
-               AND tool_name = 'axe'
-               AND tier = $3
-               AND uses_left > 0
-            """,
-            user_id, guild_id, best_tier
-        )
+        await q.execute(conn, "use_tool", user_id, guild_id, "axe", best_tier)
         # fetch the updated wood count
         wood = await get_items(conn,user_id,"wood",guild_id)
 
@@ -1026,17 +884,7 @@ async def c_mine(ctx):
     async with db_pool.acquire() as conn:
         await ensure_player(conn,ctx.author.id,guild_id)
         # 1) Fetch all usable pickaxes
-        pickaxes = await conn.fetch(
-            """
-            SELECT tier, uses_left
-              FROM tools
-             WHERE user_id = $1
-             AND guild_id = $2
-               AND tool_name = 'pickaxe'
-               AND uses_left > 0
-            """,
-            user_id,guild_id
-        )
+        pickaxes = await q.fetch(conn, "usable_tools", user_id, guild_id, "pickaxe")
 
         if not pickaxes:
             ctx.command.reset_cooldown(ctx)
@@ -1053,18 +901,7 @@ async def c_mine(ctx):
                 break
 
         # 3) Consume 1 use on that pickaxe
-        await conn.execute(
-            """
-            UPDATE tools
-               SET uses_left = uses_left - 1
-             WHERE user_id = $1
-             AND guild_id = $2
-               AND tool_name = 'pickaxe'
-               AND tier = $3
-               AND uses_left > 0
-            """,
-            user_id, guild_id, best_tier
-        )
+        await q.execute(conn, "use_tool", user_id, guild_id, "pickaxe", best_tier)
 
         # 4) Pick a drop according to your tier’s table
         table = DROP_TABLES[best_tier]
@@ -1102,14 +939,15 @@ async def c_mine(ctx):
         "⛏️ Mining... [▓▓▓▓░]",
         "⛏️ Mining... [▓▓▓▓▓]",
     ]
-    msg = await ctx.send(f"{ctx.author.mention} {frames[0]}")
+    msg = await outbound.send(ctx.channel, outbound.NORMAL, content=f"{ctx.author.mention} {frames[0]}")
     for frame in frames[1:]:
         await asyncio.sleep(0.5)
-        await msg.edit(content=f"{ctx.author.mention} {frame}")
+        # cosmetic; if the channel is busy, queued frames are replaced by newer ones
+        outbound.edit(msg, outbound.COSMETIC, content=f"{ctx.author.mention} {frame}")
 
     # --- 3) Show the result ---
     await asyncio.sleep(0.5)
-    await msg.edit(content=result)
+    await outbound.edit(msg, outbound.NORMAL, content=result)
 
 
 async def c_inv(ctx, who: str = None):
@@ -1128,25 +966,13 @@ async def c_inv(ctx, who: str = None):
     # Fetch inventory
     async with db_pool.acquire() as conn:
         # 1. Items from new table
-        items = await conn.fetch("""
-            SELECT item_name, category, quantity
-            FROM player_items
-            WHERE player_id = $1 AND guild_id = $2 AND quantity > 0
-        """, user_id, guild_id)
+        items = await q.fetch(conn, "inventory_items", user_id, guild_id)
 
         # 2. Tools
-        tools = await conn.fetch("""
-            SELECT tool_name, tier, uses_left
-            FROM tools
-            WHERE user_id = $1 AND guild_id = $2 AND uses_left > 0
-        """, user_id,guild_id)
+        tools = await q.fetch(conn, "inventory_tools", user_id, guild_id)
 
         # 3. Emeralds (still in old table)
-        emerald_row = await conn.fetchrow("""
-            SELECT emeralds
-            FROM accountinfo
-            WHERE discord_id = $1 AND guild_id = $2
-        """, user_id,guild_id)
+        emerald_row = await q.fetchrow(conn, "emeralds", user_id, guild_id)
         emeralds = emerald_row["emeralds"] if emerald_row else 0
 
     # Empty check
@@ -1243,9 +1069,7 @@ async def c_barn(ctx, who: str = None):
             ))
 
         # fetch barn size & next upgrade cost if you still want those
-        size_row = await conn.fetchrow(
-            "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2", user_id, guild_id
-        )
+        size_row = await q.fetchrow(conn, "barn_size", user_id, guild_id)
         size = size_row["barn_size"] if size_row else 5
 
         # 2) Organize by gold flag → rarity → list of (mob, count)
@@ -1258,10 +1082,7 @@ async def c_barn(ctx, who: str = None):
             data[g].setdefault(rar, []).append((name, cnt))
 
         # 3) Build embed
-        occ = await conn.fetchval(
-            "SELECT COALESCE(SUM(count),0) FROM barn WHERE user_id=$1 AND guild_id=$2",
-            user_id, guild_id
-        )
+        occ = await q.fetchval(conn, "barn_occupancy", user_id, guild_id)
     embed = discord.Embed(
         title=f"{member.display_name}'s Barn ({occ}/{size} slots)",
         color=discord.Color.green()
@@ -1302,26 +1123,17 @@ async def c_upbarn(ctx):
     async with db_pool.acquire() as conn:
         await ensure_player(conn,user_id,guild_id)
         # 2) Ensure barn_upgrades row exists
-        await conn.execute(
-            "INSERT INTO barn_upgrades (user_id, guild_id) VALUES ($1,$2) ON CONFLICT DO NOTHING;",
-            user_id,guild_id
-        )
+        await q.execute(conn, "ensure_barn_upgrades", user_id, guild_id)
 
         # 3) Get how many times they’ve upgraded
-        up = await conn.fetchrow(
-            "SELECT times_upgraded FROM barn_upgrades WHERE user_id = $1 AND guild_id = $2",
-            user_id,guild_id
-        )
+        up = await q.fetchrow(conn, "barn_upgrades", user_id, guild_id)
         times_upgraded = up["times_upgraded"]
 
         # 4) Compute next upgrade cost
         next_cost = (times_upgraded + 1) * 3
 
         # 5) Check they have enough wood
-        pl = await conn.fetchrow(
-            "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-            user_id,guild_id
-        )
+        pl = await q.fetchrow(conn, "barn_size", user_id, guild_id)
         current_size = pl["barn_size"]
 
         player_wood = await get_items(conn, user_id, "wood",guild_id)
@@ -1333,25 +1145,14 @@ async def c_upbarn(ctx):
             )
 
         # 6) Perform the upgrade
-        await take_items(user_id,"wood",next_cost,conn,guild_id)
-        await conn.execute(
-            """
-            UPDATE barn_upgrades
-               SET times_upgraded = times_upgraded + 1
-             WHERE user_id = $1 AND guild_id = $2
-            """,
-            user_id,guild_id
-        )
-
-        await conn.fetchrow(
-            "UPDATE new_players SET barn_size = barn_size+1 WHERE user_id = $1 AND guild_id=$2",
-            user_id,guild_id
-        )
+        try:
+            await take_items(user_id, "wood", next_cost, conn, guild_id)
+        except ValueError:
+            return await ctx.send(f"{ctx.author.mention} you don’t have **{next_cost} wood** any more.")
+        await q.execute(conn, "upgrade_barn", user_id, guild_id)
+        await q.execute(conn, "grow_barn", user_id, guild_id)
         # 7) Fetch post‐upgrade values
-        row = await conn.fetchrow(
-            "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-            user_id,guild_id
-        )
+        row = await q.fetchrow(conn, "barn_size", user_id, guild_id)
 
         new_wood = await get_items(conn, user_id, "wood",guild_id)
         new_size = row["barn_size"]
@@ -1361,25 +1162,28 @@ async def c_upbarn(ctx):
         f"{ctx.author.mention} upgraded their barn from **{current_size}** to **{new_size}** slots "
         f"for 🌳 **{next_cost} wood**! You now have **{new_wood} wood**."
     )
-async def tint_image(image: Image.Image, tint: tuple[int, int, int]) -> Image.Image:
-    """Tint an image with built-in shading (white/gray base), preserving shading."""
-    image = image.convert("RGBA")
-    width, height = image.size
+# tint channel value -> lookup table of int(c * brightness) for every red value 0..255
+_TINT_LUTS = {}
+_OPAQUE_LUT = [0] + [255] * 255
 
-    result = Image.new("RGBA", (width, height))
+def _tint_lut(c: int) -> list[int]:
+    lut = _TINT_LUTS.get(c)
+    if lut is None:
+        lut = _TINT_LUTS[c] = [int(c * (v / 255)) for v in range(256)]
+    return lut
 
-    for x in range(width):
-        for y in range(height):
-            r, g, b, a = image.getpixel((x, y))
-            if a == 0:
-                result.putpixel((x, y), (0, 0, 0, 0))
-                continue
+def tint_image_sync(image: Image.Image, tint: tuple[int, int, int]) -> Image.Image:
+    """Tint an image with built-in shading (white/gray base), preserving shading."""
+    image = image.convert("RGBA")
+    red, _, _, alpha = image.split()
 
-            brightness = r / 255
-            tinted = tuple(int(c * brightness) for c in tint)
-            result.putpixel((x, y), (*tinted, a))
+    # brightness comes from the red band; each output channel is tint * brightness
+    bands = [red.point(_tint_lut(c)) for c in tint]
+    tinted = Image.merge("RGBA", (*bands, alpha))
 
-    return result
+    # fully transparent pixels come out as (0, 0, 0, 0)
+    opaque = alpha.point(_OPAQUE_LUT)
+    return Image.composite(tinted, Image.new("RGBA", image.size), opaque)
 
 async def make_fish(ctx,fish_path: str):
 
@@ -1393,17 +1197,7 @@ async def make_fish(ctx,fish_path: str):
     async with db_pool.acquire() as conn:
         await ensure_player(conn,ctx.author.id,guild_id)
         # 1) Fetch all usable rods
-        rods = await conn.fetch(
-            """
-            SELECT tier, uses_left
-              FROM tools
-             WHERE user_id = $1
-               AND guild_id = $2
-               AND tool_name = 'fishing_rod'
-               AND uses_left > 0
-            """,
-            user_id, guild_id
-        )
+        rods = await q.fetch(conn, "usable_tools", user_id, guild_id, "fishing_rod")
 
         if not rods:
             ctx.command.reset_cooldown(ctx)
@@ -1418,51 +1212,19 @@ async def make_fish(ctx,fish_path: str):
                 best_tier = tier
                 break        
         # 3) Consume 1 use on that rod
-        await conn.execute(
-            """
-            UPDATE tools
-               SET uses_left = uses_left - 1
-             WHERE user_id = $1
-             AND guild_id = $2
-               AND tool_name = 'fishing_rod'
-               AND tier = $3
-               AND uses_left > 0
-            """,
-            user_id,guild_id,best_tier
-        )
+        await q.execute(conn, "use_tool", user_id, guild_id, "fishing_rod", best_tier)
         chance = random.randint(0,100)
         if chance>FISHINGCHANCE[best_tier]:
             
-            await conn.execute(
-                """
-                INSERT INTO aquarium (user_id,guild_id,color1,color2,type)
-                VALUES ($1,$2,$3,$4,$5)
-                """,
-                user_id,guild_id,color_names[0],color_names[1],typef
-            )
+            await q.execute(conn, "add_aquarium_fish", user_id, guild_id, color_names[0], color_names[1], typef)
+            _aquarium_media.pop((guild_id, user_id), None)
         else:
             return await ctx.send("You caught a sea pickle, yuck!!! you throw it back in the ocean")
             
-    base_path = f"{fish_path}{typef}/base.png"
-    overlay_path = f"{fish_path}{typef}/overlay.png"
-    base = Image.open(base_path).convert("RGBA")
-    overlay = Image.open(overlay_path).convert("RGBA")
-
-    tinted_base =await tint_image(base, color1)
-    tinted_overlay =await tint_image(overlay, color2)
-
-    result = Image.alpha_composite(tinted_base, tinted_overlay)
-    # 🔍 Scale up 20× using nearest neighbor to preserve pixel style
-    scale = 20
-    new_size = (result.width * scale, result.height * scale)
-    result = result.resize(new_size, resample=Image.NEAREST)
-    buf = io.BytesIO()
-    result.save(buf, format="PNG")
-    buf.seek(0)
-    image_bytes = buf.getvalue()
+    image_bytes, mime = await render.run("fish", render_fish_image, fish_path, typef, color1, color2)
     async with db_pool.acquire() as conn:
-        media_id = await save_image_bytes(conn, image_bytes, "image/png")
-    image_url = media_url(media_id)
+        media_id = await save_image_bytes(conn, image_bytes, mime)
+    image_url = media_url(media_id, mime)
 
     embed = discord.Embed(
         description=f"🎣 You used your **{best_tier} fishing rod** to catch a **{color_names[0]} and {color_names[1]} {typef}**!"
@@ -1471,6 +1233,134 @@ async def make_fish(ctx,fish_path: str):
     await ctx.send(embed=embed)
 
 
+# ---------- fish layers ----------
+# Tinted base/overlay layers (FISHTYPES x 2 layers x MINECRAFT_COLORS) and decoded
+# backgrounds, built on first use and kept for the life of the process. Shared by
+# every render, so never draw onto them. Process-pool workers fill their own copy.
+_tinted_layers = {}  # type: dict[tuple[str, tuple], Image.Image]
+_backgrounds = {}    # type: dict[str, Image.Image]
+
+def tinted_layer(path: str, color) -> Image.Image:
+    key = (path, tuple(color))
+    layer = _tinted_layers.get(key)
+    if layer is None:
+        layer = _tinted_layers[key] = tint_image_sync(Image.open(path), color)
+    return layer
+
+def fish_image(fish_path: str, typef: str, color1, color2) -> Image.Image:
+    """A fish at 1x: the cached tinted overlay composited onto the cached tinted base."""
+    return Image.alpha_composite(
+        tinted_layer(f"{fish_path}{typef}/base.png", color1),
+        tinted_layer(f"{fish_path}{typef}/overlay.png", color2),
+    )
+
+def aquarium_background(path: str) -> Image.Image:
+    background = _backgrounds.get(path)
+    if background is None:
+        background = _backgrounds[path] = Image.open(path).convert("RGBA")
+    return background
+
+def render_fish_image(fish_path: str, typef: str, color1, color2) -> tuple[bytes, str]:
+    """Single caught fish, scaled up for the catch embed: (data, mime). Runs on the render pool."""
+    result = fish_image(fish_path, typef, color1, color2)
+    # 🔍 Scale up 20× using nearest neighbor to preserve pixel style
+    return render.encode(result, (result.width * 20, result.height * 20))
+
+# aquarium layout, in background pixels
+FISH_SIZE = 12
+FISH_EDGE = 6   # kept clear along the tank walls
+FISH_GAP  = 2   # extra space between neighbouring fish
+FISH_RANDOM_TRIES = 30
+
+def place_fish(count: int, width: int, height: int) -> list:
+    """Top-left corners for `count` fish, None for any that don't fit.
+
+    Two fish are at least FISH_SIZE + FISH_GAP apart along one axis. Placed fish
+    sit in a grid with cells that size (at most one per cell), so a candidate only
+    checks the 3x3 cells around it. A few random tries keep the layout scattered;
+    when they all miss, every position is scanned from a random start, so a fish
+    is only left out when the tank really is full.
+    """
+    gap = FISH_SIZE + FISH_GAP
+    xs = range(FISH_EDGE, width - FISH_SIZE - FISH_EDGE + 1)
+    ys = range(FISH_EDGE, height - FISH_SIZE - FISH_EDGE + 1)
+    grid = {}  # (x // gap, y // gap) -> (x, y)
+
+    def is_free(x, y):
+        cx, cy = x // gap, y // gap
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                p = grid.get((gx, gy))
+                if p is not None and abs(x - p[0]) < gap and abs(y - p[1]) < gap:
+                    return False
+        return True
+
+    def scan():
+        n = len(xs) * len(ys)
+        start = random.randrange(n) if n else 0
+        for i in range(n):
+            k = (start + i) % n
+            x, y = xs[k % len(xs)], ys[k // len(xs)]
+            if is_free(x, y):
+                return x, y
+        return None
+
+    positions = []
+    full = not xs or not ys
+    for _ in range(count):
+        spot = None
+        if not full:
+            for _ in range(FISH_RANDOM_TRIES):
+                x, y = random.choice(xs), random.choice(ys)
+                if is_free(x, y):
+                    spot = (x, y)
+                    break
+            else:
+                spot = scan()
+                full = spot is None  # nothing fits now, and fish are only ever added
+        if spot is not None:
+            grid[(spot[0] // gap, spot[1] // gap)] = spot
+        positions.append(spot)
+    return positions
+
+def render_aquarium_image(background_path: str, fish_specs: list) -> tuple[bytes, str]:
+    """Composite the tinted fish onto the aquarium background: (data, mime). Runs on the render pool."""
+    aquarium = aquarium_background(background_path).copy()
+    width, height = aquarium.size
+    fishes = []
+    for spec in fish_specs:
+        color1_name, color2_name, fish_type = spec
+        color1 = MINECRAFT_COLORS.get(color1_name)
+        color2 = MINECRAFT_COLORS.get(color2_name)
+        if not color1 or not color2:
+            print(f"⚠️ Invalid color name: {color1_name} or {color2_name}")
+            continue
+        try:
+            fish = fish_image("assets/fish/", fish_type, color1, color2)
+        except FileNotFoundError:
+            print(f"⚠️ Missing image for fish type: {fish_type}")
+            continue
+
+        # Randomly flip 50% of fish
+        if random.choice([True, False]):
+            fish = ImageOps.mirror(fish)
+        fishes.append((spec, fish))
+
+    # Place them
+    for (spec, fish), spot in zip(fishes, place_fish(len(fishes), width, height)):
+        if spot is None:
+            print(f"⚠️ No room left in the tank for fish {spec}")
+            continue
+        aquarium.alpha_composite(fish, spot)
+    return render.encode(aquarium, (width * 4, height * 4))
+
+# (guild_id, user_id) -> (fish list it was rendered from, media id, mime, last handed out).
+# The fish list is the fingerprint: a catch or a fish aging out changes it, so a
+# stale entry is simply re-rendered; catches also drop their owner's entry straight
+# away. Entries are only reused well inside the media retention window.
+_aquarium_media = {}  # type: dict[tuple[int, int], tuple[tuple, str, str, float]]
+AQUARIUM_CACHE_SIZE = 2048
+
 async def c_generate_aquarium(ctx, who):
     background_path="assets/fish/aquarium.png"
     # Resolve who → Member (or fallback to author)
@@ -1484,92 +1374,37 @@ async def c_generate_aquarium(ctx, who):
 
     # Now you’ve got a real Member with .id, .display_name, etc.
     user_id = member.id
+    # fish older than a day are filtered here; give_fish_food_task deletes them
     async with db_pool.acquire() as conn:
-
-        await conn.execute("""
-            DELETE FROM aquarium
-            WHERE time_caught < NOW() - INTERVAL '1 day'
-        """)
-        row = await conn.fetch("""
-        SELECT color1, color2, type
-        FROM aquarium                 
-        WHERE user_id = $1
-        AND guild_id = $2
-        ORDER BY time_caught DESC
-        LIMIT 30    
-                         """,
-                         user_id,guild_id)
+        row = await q.fetch(conn, "aquarium_fish", user_id, guild_id, AQUARIUM_MAX_FISH)
     fish_specs = []
     for r in row:
         fish_specs += [[r["color1"],r["color2"],r["type"]]]
+    fingerprint = tuple(tuple(f) for f in fish_specs)
 
     unique_color1 = set(f[0] for f in fish_specs)
     unique_color2 = set(f[1] for f in fish_specs)
     unique_types  = set(f[2] for f in fish_specs)
 
     food = len(unique_color1) + len(unique_color2) + len(unique_types)
-    if len(fish_specs) > 30:
-        raise ValueError("You can only place up to 30 fish.")
-    aquarium = Image.open(background_path).convert("RGBA")
-    width, height = aquarium.size
-    fish_size = 12
-    edge_buffer = 6
-    fish_buffer = 2
-    placed_positions = []
-
-    def is_valid_position(x, y):
-        for px, py in placed_positions:
-            if abs(x - px) < fish_size + fish_buffer and abs(y - py) < fish_size + fish_buffer:
-                return False
-        return True
-    for spec in fish_specs:
-        color1_name, color2_name, fish_type = spec
-        color1 = MINECRAFT_COLORS.get(color1_name)
-        color2 = MINECRAFT_COLORS.get(color2_name)
-        if not color1 or not color2:
-            print(f"⚠️ Invalid color name: {color1_name} or {color2_name}")
-            continue
-        base_path = f"assets/fish/{fish_type}/base.png"
-        overlay_path = f"assets/fish/{fish_type}/overlay.png"
-        if not (os.path.exists(base_path) and os.path.exists(overlay_path)):
-            print(f"⚠️ Missing image for fish type: {fish_type}")
-            continue
-        base = Image.open(base_path).convert("RGBA")
-        overlay = Image.open(overlay_path).convert("RGBA")
-        tinted_base = await tint_image(base, color1)
-        tinted_overlay = await tint_image(overlay, color2)
-        fish_image = Image.alpha_composite(tinted_base, tinted_overlay)
-        scale = 1
-        new_size = (fish_image.width * scale, fish_image.height * scale)
-        fish_image = fish_image.resize(new_size, resample=Image.NEAREST)
-
-        # Randomly flip 50% of fish
-        if random.choice([True, False]):
-            fish_image = ImageOps.mirror(fish_image)
-
-        # Place it
-        tries = 0
-        while tries < 1000:
-            x = random.randint(edge_buffer, width - fish_size*scale - edge_buffer)
-            y = random.randint(edge_buffer, height - fish_size*scale - edge_buffer)
-            if is_valid_position(x, y):
-                aquarium.alpha_composite(fish_image, (x, y))
-                placed_positions.append((x, y))
-                break
-            tries += 1
-        else:
-            print(f"⚠️ Could not place fish {spec} after 1000 attempts")
-    result = aquarium
-    scale = 4
-    new_size = (result.width * scale, result.height * scale)
-    result = result.resize(new_size, resample=Image.NEAREST)
-    buf = io.BytesIO()
-    result.save(buf, format="PNG")
-    buf.seek(0)
-    image_bytes = buf.getvalue()
-    async with db_pool.acquire() as conn:
-        media_id = await save_image_bytes(conn, image_bytes, "image/png")
-    image_url = media_url(media_id)
+    if len(fish_specs) > AQUARIUM_MAX_FISH:
+        raise ValueError(f"You can only place up to {AQUARIUM_MAX_FISH} fish.")
+    cached = _aquarium_media.get((guild_id, user_id))
+    now = time.monotonic()
+    if (cached is not None and cached[0] == fingerprint
+            and now - cached[3] < mediastore.MEDIA_RETENTION.total_seconds() / 2):
+        _, media_id, mime, _ = cached
+        mediastore.touch(media_id)
+        _aquarium_media[(guild_id, user_id)] = (fingerprint, media_id, mime, now)
+    else:
+        image_bytes, mime = await render.run("aquarium", render_aquarium_image, background_path, fish_specs)
+        async with db_pool.acquire() as conn:
+            media_id = await save_image_bytes(conn, image_bytes, mime)
+        _aquarium_media.pop((guild_id, user_id), None)
+        while len(_aquarium_media) >= AQUARIUM_CACHE_SIZE:
+            del _aquarium_media[next(iter(_aquarium_media))]  # oldest render first
+        _aquarium_media[(guild_id, user_id)] = (fingerprint, media_id, mime, now)
+    image_url = media_url(media_id, mime)
 
     embed = discord.Embed(
         title=f"{member.display_name}'s Aquarium",
@@ -1599,11 +1434,7 @@ async def c_use(ctx, bot, item_name, quantity):
 
     async with db_pool.acquire() as conn:
         # Check if they have it and it’s useable
-        row = await conn.fetchrow("""
-            SELECT quantity, useable
-            FROM player_items
-            WHERE player_id = $1 AND LOWER(item_name) = $2 AND guild_id = $3
-        """, user_id, item_name,guild_id)
+        row = await q.fetchrow(conn, "usable_item", user_id, guild_id, item_name)
 
         if not row:
             return await ctx.send(f"❌ You don’t have any **{item_name}**.")
@@ -1613,19 +1444,11 @@ async def c_use(ctx, bot, item_name, quantity):
             return await ctx.send(f"❌ You only have {row['quantity']} **{item_name}**.")
         if item_name == "fish food" and quantity%100 != 0:
             return await ctx.send(f"❌ You must put an amount of fish food divisible by 100.")
-        # Deduct quantity or delete
-        remaining = row["quantity"] - quantity
-        if remaining > 0:
-            await conn.execute("""
-                UPDATE player_items
-                SET quantity = $1
-                WHERE player_id = $2 AND LOWER(item_name) = $3 AND guild_id = $4
-            """, remaining, user_id, item_name,guild_id)
-        else:
-            await conn.execute("""
-                DELETE FROM player_items
-                WHERE player_id = $1 AND LOWER(item_name) = $2 AND guild_id = $3
-            """, user_id, item_name,guild_id)
+        # Deduct quantity (the row as stored, whatever its capitalisation)
+        try:
+            await take_items(user_id, row["item_name"], quantity, conn, guild_id)
+        except ValueError:
+            return await ctx.send(f"❌ You don’t have {quantity} **{item_name}** any more.")
     # 🎉 Effect (optional)
     if item_name == "mystery mob pack":
         got = []
@@ -1639,19 +1462,10 @@ async def c_use(ctx, bot, item_name, quantity):
                 mobs = ([m for m,v in MOBS.items() if not v["hostile"]])
                 mob = random.choices(mobs, weights=weights, k=1)[0]
                 
-                await conn.execute(
-                    "INSERT INTO barn_upgrades (user_id,guild_id) VALUES ($1,$2) ON CONFLICT DO NOTHING;",
-                    user_id,guild_id
-                )
+                await q.execute(conn, "ensure_barn_upgrades", user_id, guild_id)
                 # count current barn occupancy
-                occ = await conn.fetchval(
-                    "SELECT COALESCE(SUM(count),0) FROM barn WHERE user_id = $1 AND guild_id = $2",
-                    user_id,guild_id
-                )
-                size = await conn.fetchval(
-                    "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
-                    user_id,guild_id
-                )
+                occ = await q.fetchval(conn, "barn_occupancy", user_id, guild_id)
+                size = await q.fetchval(conn, "barn_size", user_id, guild_id)
                 if occ >= size:
                     sac = True
                     reward = await sucsac(ctx.channel,ctx.author,mob,is_golden,"because the barn was too full",conn)
@@ -1692,11 +1506,11 @@ async def c_use(ctx, bot, item_name, quantity):
 async def c_stronghold(ctx):
     guild_id = gid_from_ctx(ctx)
     async with db_pool.acquire() as conn:
-        cobble = await get_items(conn, ctx.author.id, "cobblestone",guild_id)
-        totems = await get_items(conn, ctx.author.id, "totem",guild_id)
-        if cobble < 6:
+        try:
+            await take_items(ctx.author.id, "cobblestone", 6, conn,guild_id)
+        except ValueError:
             return await ctx.send(f"❌ You need 6 cobblestone to enter")
-        await take_items(ctx.author.id, "cobblestone", 6, conn,guild_id)
+        totems = await get_items(conn, ctx.author.id, "totem",guild_id)
     
     view = PathButtons(level=0, collected={}, player_id=ctx.author.id, db_pool=db_pool, used_totem=False, totems=totems,guild_id=guild_id)
     embed = discord.Embed(
@@ -215,3 +215,5 @@ MINECRAFT_COLORS = {
 }
 FISHTYPES = ["flopper","stripey","glitter","blockfish","betty","clayfish","kob","sunstreak","snooper","dasher","brinely","spotty"]
 FISHINGCHANCE={None:1,"wood":60,"stone":50,"iron":30,"gold":20,"diamond":10}
+# fish shown in (and feeding from) an aquarium: the most recent catches of the last day
+AQUARIUM_MAX_FISH = 30
@@ -0,0 +1,259 @@
+"""Where rendered image bytes live.
+
+Every image has a row in `media` (id, mime, sha256). Its bytes are either in the
+row's `bytes` column or, once written by the filesystem backend, in a file named
+after the content hash, with `bytes` left NULL:
+
+    MEDIA_BACKEND   "db" (default) or "fs": where new images are written
+    MEDIA_DIR       root of the file store (default "media"), <dir>/ab/cd/abcd…
+    MEDIA_CACHE_MB  recently served images kept in memory (default 32)
+    MEDIA_RETENTION_DAYS  images neither served nor re-rendered for this long are deleted (default 30)
+
+Reads don't depend on the setting: a row with NULL bytes is served from disk.
+Existing rows are moved out of the table with
+
+    python mediastore.py migrate [batch_size]
+"""
+import os
+import sys
+import asyncio
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+import metrics
+import queries as q
+
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "db").lower()
+MEDIA_DIR     = os.getenv("MEDIA_DIR", "media")
+MEDIA_CACHE_BYTES = int(os.getenv("MEDIA_CACHE_MB", 32)) * 1024 * 1024
+MEDIA_RETENTION = timedelta(days=float(os.getenv("MEDIA_RETENTION_DAYS", 30)))
+MEDIA_GC_BATCH = 500
+
+# file name suffix per stored mime, for URLs and downloads
+MEDIA_SUFFIXES = {"image/png": ".png", "image/webp": ".webp"}
+
+def suffix_for(mime: str) -> str:
+    return MEDIA_SUFFIXES.get(mime, ".png")
+
+
+async def ensure_schema(conn: asyncpg.Connection):
+    """Content hash column for media; rows stored before it existed keep a NULL hash."""
+    await conn.execute("ALTER TABLE media ADD COLUMN IF NOT EXISTS sha256 bytea")
+    await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS media_sha256_key ON media (sha256)")
+    # rows whose bytes live on disk keep only their metadata
+    await conn.execute("ALTER TABLE media ALTER COLUMN bytes DROP NOT NULL")
+    # retention: byte count for reporting, and when the image was last served or handed out
+    await conn.execute("ALTER TABLE media ADD COLUMN IF NOT EXISTS size integer")
+    await conn.execute("ALTER TABLE media ADD COLUMN IF NOT EXISTS last_used_at timestamptz NOT NULL DEFAULT now()")
+    await conn.execute("CREATE INDEX IF NOT EXISTS media_last_used_at_idx ON media (last_used_at)")
+
+
+def path_for(digest: bytes) -> str:
+    h = digest.hex()
+    return os.path.join(MEDIA_DIR, h[:2], h[2:4], h)
+
+def _write_file(path: str, data: bytes):
+    if os.path.exists(path):
+        return  # same hash, same bytes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+# held while a file's row is written or its removal decided, so the GC never
+# deletes a file that a save has just (re)used. Callers of either side already
+# hold a pool connection when they take it, never the other way round.
+_files_lock = asyncio.Lock()
+
+async def save(conn: asyncpg.Connection, data: bytes, mime: str = "image/png") -> str:
+    """Store an image by content hash; identical bytes get the id (and URL) already stored."""
+    digest = hashlib.sha256(data).digest()
+    # rows written to the table have no file for the GC to remove
+    async with _files_lock if MEDIA_BACKEND == "fs" else nullcontext():
+        # most repeats are found without shipping the bytes anywhere again
+        media_id = await q.fetchval(conn, "reuse_media", digest)
+        if media_id is not None:
+            return str(media_id)
+        path = None
+        if MEDIA_BACKEND == "fs":
+            # file first, so a row never points at bytes that aren't there
+            path = path_for(digest)
+            await asyncio.to_thread(_write_file, path, data)
+        media_id = await q.fetchval(conn, "save_media", mime, None if path else data, digest, len(data))
+    # Discord fetches a new image as soon as its embed is posted
+    _remember(media_id, mime, digest, None if path else data, path)
+    return str(media_id)
+
+
+# ---------- hot cache ----------
+# media id -> {"mime", "etag", "body", "path"}, least recently served evicted first.
+# Images in the table keep their bytes here; images on disk only their path, since
+# those go out with sendfile anyway.
+_hot = OrderedDict()  # type: OrderedDict[uuid.UUID, dict]
+_hot_bytes = 0
+_ENTRY_OVERHEAD = 256  # rough size of an entry without its body
+
+def _remember(media_id: uuid.UUID, mime: str, digest: bytes | None, body: bytes | None, path: str | None) -> dict:
+    global _hot_bytes
+    entry = {
+        "mime": mime,
+        # content hash where we have one, so the same image under two ids validates alike
+        "etag": digest.hex() if digest is not None else str(media_id),
+        "body": body,
+        "path": path,
+    }
+    size = _ENTRY_OVERHEAD + len(body or b"")
+    if size > MEDIA_CACHE_BYTES:
+        return entry
+    old = _hot.pop(media_id, None)
+    if old is not None:
+        _hot_bytes -= _ENTRY_OVERHEAD + len(old["body"] or b"")
+    _hot[media_id] = entry
+    _hot_bytes += size
+    while _hot_bytes > MEDIA_CACHE_BYTES:
+        _, old = _hot.popitem(last=False)
+        _hot_bytes -= _ENTRY_OVERHEAD + len(old["body"] or b"")
+    return entry
+
+async def lookup(pool, media_id: uuid.UUID) -> dict | None:
+    """How to serve an image: {"mime", "etag", "body" or "path"}, or None if there is no such id.
+
+    Hot images come from memory without touching the pool.
+    """
+    entry = _hot.get(media_id)
+    if entry is not None:
+        touch(media_id)
+        _hot.move_to_end(media_id)
+        metrics.inc("beenbag_media_cache_total", result="hit")
+        return entry
+    metrics.inc("beenbag_media_cache_total", result="miss")
+    async with pool.acquire() as conn:
+        row = await q.fetchrow(conn, "load_media", media_id)
+    if row is None:
+        return None
+    touch(media_id)
+    if row["bytes"] is None:
+        return _remember(media_id, row["mime"], row["sha256"], None, path_for(row["sha256"]))
+    return _remember(media_id, row["mime"], row["sha256"], bytes(row["bytes"]), None)
+
+
+# ---------- retention ----------
+# media ids served or handed out again since the last flush; written in one UPDATE
+_touched = set()  # type: set[uuid.UUID]
+
+def touch(media_id):
+    """Mark an image as still in use (it is served, or its URL is being posted again)."""
+    _touched.add(media_id if isinstance(media_id, uuid.UUID) else uuid.UUID(media_id))
+
+async def flush_touches(pool):
+    if not _touched:
+        return
+    ids = list(_touched)
+    _touched.clear()
+    async with pool.acquire() as conn:
+        await q.execute(conn, "touch_media", ids)
+
+async def collect_garbage(pool, max_age: timedelta = MEDIA_RETENTION, batch: int = MEDIA_GC_BATCH) -> dict:
+    """Delete images unused for `max_age`, `batch` rows per statement, plus their files and cache entries.
+
+    Each batch is its own short statement and skips rows other sessions hold,
+    so the table is never locked for long. Returns {"deleted": n, "bytes": n}.
+    """
+    await flush_touches(pool)
+    cutoff = datetime.now(timezone.utc) - max_age
+    deleted = reclaimed = 0
+    while True:
+        async with pool.acquire() as conn:
+            rows = await q.fetch(conn, "gc_media", cutoff, batch)
+        if not rows:
+            break
+        deleted += len(rows)
+        reclaimed += sum(r["size"] for r in rows)
+        for r in rows:
+            _forget(r["id"])
+
+        on_disk = [r["sha256"] for r in rows if r["on_disk"]]
+        if on_disk:
+            # connection before lock, as in save(): the other order deadlocks
+            # once the pool is exhausted by saves waiting on the lock
+            async with pool.acquire() as conn, _files_lock:
+                kept = {r["sha256"] for r in await q.fetch(conn, "media_hashes_in_use", on_disk)}
+                await asyncio.to_thread(_remove_files, [path_for(d) for d in on_disk if d not in kept])
+        if len(rows) < batch:
+            break
+
+    metrics.inc("beenbag_media_gc_deleted_total", deleted)
+    metrics.inc("beenbag_media_gc_reclaimed_bytes_total", reclaimed)
+    logging.info(f"[media] gc removed {deleted} images unused since {cutoff:%Y-%m-%d}, reclaimed {reclaimed / 1024:.1f} KiB")
+    return {"deleted": deleted, "bytes": reclaimed}
+
+def _forget(media_id: uuid.UUID):
+    global _hot_bytes
+    entry = _hot.pop(media_id, None)
+    if entry is not None:
+        _hot_bytes -= _ENTRY_OVERHEAD + len(entry["body"] or b"")
+
+def _remove_files(paths: list[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ---------- migration ----------
+async def migrate(conn: asyncpg.Connection, batch: int = 200) -> dict:
+    """Move every row's bytes to MEDIA_DIR, batch by batch, keeping ids (and URLs) as they are.
+
+    Rows stored before hashing whose content matches another row's hash can't take
+    that hash (it is unique), so they are left in the table and counted as duplicates.
+    """
+    moved = duplicates = 0
+    last = uuid.UUID(int=0)
+    while True:
+        rows = await conn.fetch("""
+            SELECT id, bytes, sha256 FROM media
+             WHERE bytes IS NOT NULL AND id > $1
+             ORDER BY id
+             LIMIT $2
+        """, last, batch)
+        if not rows:
+            break
+        for row in rows:
+            last = row["id"]
+            data = bytes(row["bytes"])
+            digest = row["sha256"] or hashlib.sha256(data).digest()
+            _write_file(path_for(digest), data)
+            try:
+                await conn.execute(
+                    "UPDATE media SET sha256 = $2, size = octet_length(bytes), bytes = NULL WHERE id = $1",
+                    row["id"], digest,
+                )
+                moved += 1
+            except asyncpg.UniqueViolationError:
+                duplicates += 1
+        logging.info(f"[media] moved {moved} images to {MEDIA_DIR} ({duplicates} duplicates kept in the table)")
+    return {"moved": moved, "duplicates": duplicates}
+
+
+async def _main(argv):
+    if not argv or argv[0] != "migrate":
+        raise SystemExit("usage: python mediastore.py migrate [batch_size]")
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        await ensure_schema(conn)
+        await migrate(conn, int(argv[1]) if len(argv) > 1 else 200)
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1:]))
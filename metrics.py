@@ -0,0 +1,139 @@
+"""Lightweight in-process metrics, rendered in the Prometheus text format on /metrics."""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import aiohttp
+
+# latency histogram upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP = {
+    "beenbag_message_stage_seconds":   ("histogram", "Time spent in each stage of on_message."),
+    "beenbag_command_seconds":         ("histogram", "Command invocation time, from before_invoke to after_invoke."),
+    "beenbag_commands_total":          ("counter",   "Commands invoked, by outcome."),
+    "beenbag_pool_acquire_seconds":    ("histogram", "Time spent waiting for a pooled Postgres connection."),
+    "beenbag_discord_requests_total":  ("counter",   "HTTP requests made to the Discord API, by method and status."),
+    "beenbag_discord_request_seconds": ("histogram", "Discord API request latency."),
+    "beenbag_chat_exp_flush_seconds":  ("histogram", "Time taken to write one batch of buffered chat EXP."),
+    "beenbag_outbound_queue_depth":    ("gauge",     "Sends and edits waiting in the outbound queue."),
+    "beenbag_outbound_throttled_total":      ("counter", "Times the outbound queue waited for a channel or global token."),
+    "beenbag_outbound_coalesced_total":      ("counter", "Edits merged into an edit of the same message that was still queued."),
+    "beenbag_outbound_rate_limited_total":   ("counter", "Outbound calls that still failed with a 429."),
+    "beenbag_spawn_frame_cache_total":       ("counter", "Spawn reveal frame lookups, by cache hit or miss."),
+    "beenbag_media_cache_total":             ("counter", "/i/ image lookups, by hot cache hit or miss."),
+    "beenbag_media_gc_deleted_total":        ("counter", "Media rows removed by the retention job."),
+    "beenbag_media_gc_reclaimed_bytes_total": ("counter", "Image bytes freed by the retention job (table and disk)."),
+    "beenbag_render_seconds":          ("histogram", "Time a render job spent running on a pool worker."),
+    "beenbag_render_wait_seconds":     ("histogram", "Time a render job waited for a pool slot or worker."),
+}
+
+# (name, labels) -> value; gauges share this table and are overwritten instead of added to
+_counters = {}    # type: dict[tuple[str, tuple], float]
+# (name, labels) -> [per-bucket counts (+Inf last), sum, count]
+_histograms = {}  # type: dict[tuple[str, tuple], list]
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name: str, value: float, **labels):
+    _counters[_key(name, labels)] = value
+
+def observe(name: str, seconds: float, **labels):
+    key = _key(name, labels)
+    h = _histograms.get(key)
+    if h is None:
+        h = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+    h[0][bisect_left(BUCKETS, seconds)] += 1
+    h[1] += seconds
+    h[2] += 1
+
+@contextmanager
+def timed(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    names = sorted({n for n, _ in _counters} | {n for n, _ in _histograms})
+    for name in names:
+        kind, text = _HELP.get(name, ("untyped", ""))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (n, labels), value in sorted(_counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+        for (n, labels), (buckets, total, count) in sorted(_histograms.items()):
+            if n != name:
+                continue
+            running = 0
+            for bound, c in zip(BUCKETS, buckets):
+                running += c
+                lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', bound),))} {running}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Postgres pool ----------
+class _TimedAcquire:
+    def __init__(self, ctx):
+        self._ctx = ctx
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        conn = await self._ctx.__aenter__()
+        observe("beenbag_pool_acquire_seconds", time.perf_counter() - start)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+class TimedPool:
+    """Wraps an asyncpg pool so `async with pool.acquire()` records its wait time."""
+    def __init__(self, pool):
+        self._pool = pool
+
+    def acquire(self, *, timeout=None):
+        return _TimedAcquire(self._pool.acquire(timeout=timeout))
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+# ---------- Discord HTTP ----------
+async def _on_request_start(session, ctx, params):
+    ctx.start = time.perf_counter()
+
+async def _on_request_end(session, ctx, params):
+    observe("beenbag_discord_request_seconds", time.perf_counter() - ctx.start)
+    inc("beenbag_discord_requests_total", method=params.method, status=str(params.response.status))
+
+async def _on_request_exception(session, ctx, params):
+    inc("beenbag_discord_requests_total", method=params.method, status="error")
+
+def discord_trace_config() -> aiohttp.TraceConfig:
+    """Trace config for the bot's aiohttp session; counts every API call (429s show up by status)."""
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_request_end.append(_on_request_end)
+    trace.on_request_exception.append(_on_request_exception)
+    return trace
@@ -0,0 +1,150 @@
+"""Paced, prioritised queue for outgoing Discord sends and edits.
+
+Each channel gets its own queue, drained by a short-lived task that exits when
+the queue is empty. Before every call the drainer takes a token from the
+channel's bucket and from the bot-wide bucket, so we wait on our side instead of
+collecting 429s. An edit to a message that already has an edit waiting is merged
+into it, so only the newest frame goes out.
+
+    msg = await outbound.send(channel, outbound.CRITICAL, embed=e)
+    outbound.edit(msg, outbound.COSMETIC, content="frame 3")   # fire and forget
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+import discord
+
+import metrics
+
+# priorities, lowest number first
+CRITICAL = 0   # spawns, captures
+NORMAL   = 1   # level-ups, escape notices, command results
+COSMETIC = 2   # reveal frames, animation frames
+
+# Discord allows about 5 messages per 5 s per channel and 50 requests/s overall
+CHANNEL_RATE, CHANNEL_BURST = 1.0, 5
+GLOBAL_RATE,  GLOBAL_BURST  = 45.0, 45
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    async def take(self, name: str):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            metrics.inc("beenbag_outbound_throttled_total", bucket=name)
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Job:
+    __slots__ = ("entry", "call", "kwargs", "futures", "edit_of")
+
+    def __init__(self, call, kwargs, edit_of=None):
+        self.entry = None         # [priority, seq, job] as stored on the channel heap
+        self.call = call          # coroutine function taking **kwargs
+        self.kwargs = kwargs
+        self.futures = []
+        self.edit_of = edit_of    # message id for coalescable edits
+
+
+_queues = {}    # channel_id -> heap of [priority, seq, job]
+_drainers = {}  # channel_id -> task
+_buckets = {}   # channel_id -> _Bucket
+_edits = {}     # message id -> queued edit job
+_global = _Bucket(GLOBAL_RATE, GLOBAL_BURST)
+_seq = itertools.count()
+_depth = 0
+
+
+def _log_failure(fut: asyncio.Future):
+    # retrieve the exception so fire-and-forget calls don't warn; awaiting callers still get it
+    if not fut.cancelled() and fut.exception() is not None:
+        logging.warning(f"[outbound] {type(fut.exception()).__name__}: {fut.exception()}")
+
+def _future() -> asyncio.Future:
+    fut = asyncio.get_running_loop().create_future()
+    fut.add_done_callback(_log_failure)
+    return fut
+
+def _set_depth(delta: int):
+    global _depth
+    _depth += delta
+    metrics.set_gauge("beenbag_outbound_queue_depth", _depth)
+
+def _enqueue(channel_id: int, priority: int, job: _Job):
+    job.entry = [priority, next(_seq), job]
+    heapq.heappush(_queues.setdefault(channel_id, []), job.entry)
+    _set_depth(1)
+    task = _drainers.get(channel_id)
+    if task is None or task.done():
+        _drainers[channel_id] = asyncio.create_task(_drain(channel_id))
+
+
+def send(channel: discord.abc.Messageable, priority: int = NORMAL, **kwargs) -> asyncio.Future:
+    """Queue channel.send(**kwargs); the future resolves to the sent Message."""
+    job = _Job(channel.send, kwargs)
+    fut = _future()
+    job.futures.append(fut)
+    _enqueue(channel.id, priority, job)
+    return fut
+
+def edit(message: discord.Message, priority: int = COSMETIC, **kwargs) -> asyncio.Future:
+    """Queue message.edit(**kwargs), replacing any edit of the same message still waiting."""
+    fut = _future()
+    job = _edits.get(message.id)
+    if job is not None:
+        # superseded: the waiting edit now carries these contents, and answers both callers
+        job.kwargs = kwargs
+        job.futures.append(fut)
+        if priority < job.entry[0]:
+            job.entry[0] = priority
+            heapq.heapify(_queues[message.channel.id])
+        metrics.inc("beenbag_outbound_coalesced_total")
+        return fut
+    job = _Job(message.edit, kwargs, edit_of=message.id)
+    job.futures.append(fut)
+    _edits[message.id] = job
+    _enqueue(message.channel.id, priority, job)
+    return fut
+
+
+async def _drain(channel_id: int):
+    queue = _queues[channel_id]
+    bucket = _buckets.setdefault(channel_id, _Bucket(CHANNEL_RATE, CHANNEL_BURST))
+    try:
+        while queue:
+            await bucket.take("channel")
+            await _global.take("global")
+            # pop after waiting, so anything more urgent queued meanwhile goes first
+            _, _, job = heapq.heappop(queue)
+            _set_depth(-1)
+            if job.edit_of is not None:
+                _edits.pop(job.edit_of, None)
+            try:
+                result = await job.call(**job.kwargs)
+            except Exception as e:
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    metrics.inc("beenbag_outbound_rate_limited_total")
+                for fut in job.futures:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for fut in job.futures:
+                    if not fut.done():
+                        fut.set_result(result)
+    finally:
+        if not queue:
+            _queues.pop(channel_id, None)
+        _drainers.pop(channel_id, None)
@@ -0,0 +1,331 @@
+"""Named SQL for the hot paths, prepared once on every pooled connection.
+
+Create the pool with `connection_class=PreparedConnection, init=prepare_all`, then
+run statements by name: `await q.fetchval(conn, "barn_size", user_id, guild_id)`.
+Parameters always lead with user_id, guild_id when a statement takes them.
+"""
+import logging
+
+import asyncpg
+
+SQL = {
+    # ---------- players ----------
+    "ensure_player": """
+        INSERT INTO new_players (user_id, guild_id) VALUES ($1, $2)
+        ON CONFLICT DO NOTHING
+    """,
+    "ensure_barn_upgrades": """
+        INSERT INTO barn_upgrades (user_id, guild_id) VALUES ($1, $2)
+        ON CONFLICT DO NOTHING
+    """,
+    "gain_exp": """
+        UPDATE accountinfo
+           SET experience = COALESCE(experience, 0) + $3, overallexp = overallexp + $3
+         WHERE discord_id = $1 AND guild_id = $2
+        RETURNING experience - $3 AS old_exp, experience AS new_exp
+    """,
+    "flush_chat_exp": """
+        INSERT INTO accountinfo (guild_id, discord_id, experience, overallexp)
+        SELECT g, d, e, e FROM unnest($1::bigint[], $2::bigint[], $3::int[]) AS t(g, d, e)
+        ON CONFLICT (discord_id, guild_id) DO UPDATE
+           SET experience = COALESCE(accountinfo.experience, 0) + EXCLUDED.experience,
+               overallexp = COALESCE(accountinfo.overallexp, 0) + EXCLUDED.overallexp
+         WHERE EXCLUDED.experience > 0
+        RETURNING guild_id, discord_id, experience
+    """,
+    "emeralds": "SELECT emeralds FROM accountinfo WHERE discord_id = $1 AND guild_id = $2",
+
+    # ---------- tools ----------
+    "usable_tools": """
+        SELECT tier, uses_left
+          FROM tools
+         WHERE user_id = $1 AND guild_id = $2 AND tool_name = $3 AND uses_left > 0
+    """,
+    "use_tool": """
+        UPDATE tools
+           SET uses_left = uses_left - 1
+         WHERE user_id = $1 AND guild_id = $2 AND tool_name = $3 AND tier = $4 AND uses_left > 0
+    """,
+    # $3 tool, $4 tier, $5 uses
+    "give_tool": """
+        INSERT INTO tools (user_id, guild_id, tool_name, tier, uses_left)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (user_id, guild_id, tool_name, tier) DO UPDATE
+          SET uses_left = tools.uses_left + EXCLUDED.uses_left
+    """,
+    "inventory_tools": """
+        SELECT tool_name, tier, uses_left
+          FROM tools
+         WHERE user_id = $1 AND guild_id = $2 AND uses_left > 0
+    """,
+
+    # ---------- items ----------
+    "inventory_items": """
+        SELECT item_name, category, quantity
+          FROM player_items
+         WHERE player_id = $1 AND guild_id = $2 AND quantity > 0
+    """,
+    # $3 ore the recipe needs (NULL for wood only)
+    "craft_resources": """
+        SELECT MAX(CASE WHEN item_name = 'wood' THEN quantity ELSE 0 END) AS wood,
+               MAX(CASE WHEN item_name = $3 THEN quantity ELSE 0 END) AS ore_have
+          FROM player_items
+         WHERE player_id = $1 AND guild_id = $2 AND item_name IN ('wood', $3)
+    """,
+    # $3 lowercased item name
+    "usable_item": """
+        SELECT item_name, quantity, useable
+          FROM player_items
+         WHERE player_id = $1 AND guild_id = $2 AND LOWER(item_name) = $3
+    """,
+    "item_quantity": """
+        SELECT quantity FROM player_items
+         WHERE player_id = $1 AND guild_id = $2 AND item_name = $3
+    """,
+    # $3 item, $4 amount, $5 category, $6 useable; returns the new quantity
+    "give_item": """
+        INSERT INTO player_items (player_id, guild_id, item_name, quantity, category, useable)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (guild_id, player_id, item_name)
+        DO UPDATE SET quantity = player_items.quantity + EXCLUDED.quantity
+        RETURNING quantity
+    """,
+    # $3 item, $4 amount; no row back means the balance was too low (nothing changed)
+    "take_item": """
+        UPDATE player_items SET quantity = quantity - $4
+         WHERE player_id = $1 AND guild_id = $2 AND item_name = $3 AND quantity >= $4
+        RETURNING quantity
+    """,
+    # only still-empty rows: a give that landed in between keeps its row
+    "delete_empty_item": """
+        DELETE FROM player_items
+         WHERE player_id = $1 AND guild_id = $2 AND item_name = $3 AND quantity <= 0
+    """,
+
+    # ---------- barn ----------
+    "barn_size": "SELECT barn_size FROM new_players WHERE user_id = $1 AND guild_id = $2",
+    "barn_upgrades": "SELECT times_upgraded FROM barn_upgrades WHERE user_id = $1 AND guild_id = $2",
+    "upgrade_barn": """
+        UPDATE barn_upgrades
+           SET times_upgraded = times_upgraded + 1
+         WHERE user_id = $1 AND guild_id = $2
+    """,
+    "grow_barn": "UPDATE new_players SET barn_size = barn_size + 1 WHERE user_id = $1 AND guild_id = $2",
+    "barn_occupancy": "SELECT COALESCE(SUM(count), 0) FROM barn WHERE user_id = $1 AND guild_id = $2",
+    "mob_count": """
+        SELECT count FROM barn
+         WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3 AND is_golden = false
+    """,
+    "give_mob": """
+        INSERT INTO barn (user_id, guild_id, mob_name, is_golden, count)
+        VALUES ($1, $2, $3, false, 1)
+        ON CONFLICT (user_id, mob_name, is_golden)
+        DO UPDATE SET count = barn.count + 1
+        RETURNING count
+    """,
+    # $3 mob; the gift is a plain mob when the giver has one
+    "mob_to_give": """
+        SELECT is_golden, count
+          FROM barn
+         WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3
+         ORDER BY is_golden ASC
+         LIMIT 1
+    """,
+    # $3 mob, $4 is_golden
+    "take_mob": """
+        UPDATE barn
+           SET count = count - 1
+         WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3 AND is_golden = $4
+    """,
+    "remove_mob": """
+        DELETE FROM barn
+         WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3 AND is_golden = $4
+    """,
+    # $3 mob, $4 is_golden
+    "receive_mob": """
+        INSERT INTO barn (guild_id, user_id, mob_name, is_golden, count)
+        VALUES ($2, $1, $3, $4, 1)
+        ON CONFLICT (guild_id, user_id, mob_name, is_golden)
+        DO UPDATE SET count = barn.count + 1
+    """,
+    # $3 mob; golden ones are sacrificed first
+    "mob_to_sacrifice": """
+        SELECT count, is_golden
+          FROM barn
+         WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3
+         ORDER BY is_golden DESC
+         LIMIT 1
+    """,
+    "sacrifice_mob": "UPDATE barn SET count = count - 1 WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3",
+    "sacrifice_last_mob": "DELETE FROM barn WHERE user_id = $1 AND guild_id = $2 AND mob_name = $3",
+    "record_sacrifice": """
+        INSERT INTO sacrifice_history (discord_id, guild_id, mob_name, is_golden, rarity)
+        VALUES ($1, $2, $3, $4, $5)
+    """,
+
+    # ---------- shop ----------
+    "shop_items": """
+        SELECT item_id, name, description, price_emeralds, purchase_limit
+          FROM shop_items
+         ORDER BY item_id
+    """,
+    # $1 lowercased item name
+    "shop_item": """
+        SELECT item_id, name, price_emeralds, purchase_limit
+          FROM shop_items
+         WHERE LOWER(name) = $1
+    """,
+    # $3 item_id, $4 since
+    "purchases_since": """
+        SELECT COUNT(*) FROM purchase_history
+         WHERE user_id = $1 AND guild_id = $2 AND item_id = $3 AND purchased_at > $4
+    """,
+    "record_purchase": "INSERT INTO purchase_history (user_id, guild_id, item_id) VALUES ($1, $2, $3)",
+    # $3 item_id, $4 quantity
+    "add_shop_purchase": """
+        INSERT INTO shop_purchases (user_id, guild_id, item_id, quantity)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id, item_id, guild_id) DO UPDATE
+          SET quantity = shop_purchases.quantity + $4
+    """,
+
+    # ---------- aquarium ----------
+    # $3 how many fish fit (AQUARIUM_MAX_FISH)
+    "aquarium_fish": """
+        SELECT color1, color2, type
+          FROM aquarium
+         WHERE user_id = $1 AND guild_id = $2 AND time_caught >= NOW() - INTERVAL '1 day'
+         ORDER BY time_caught DESC
+         LIMIT $3
+    """,
+    "add_aquarium_fish": """
+        INSERT INTO aquarium (user_id, guild_id, color1, color2, type)
+        VALUES ($1, $2, $3, $4, $5)
+    """,
+
+    # ---------- media ----------
+    # $1 sha256 of the bytes; marking it used locks the row, so a running GC batch either
+    # skips it or has already deleted it (no row back: store it again)
+    "reuse_media": "UPDATE media SET last_used_at = now() WHERE sha256 = $1 RETURNING id",
+    # $1 media id
+    "load_media": "SELECT mime, bytes, sha256 FROM media WHERE id = $1",
+    # $1 mime, $2 bytes, $3 sha256, $4 size; returns the existing row's id when the content is already stored
+    "save_media": """
+        INSERT INTO media (mime, bytes, sha256, size) VALUES ($1, $2, $3, $4)
+        ON CONFLICT (sha256) DO UPDATE SET last_used_at = now()
+        RETURNING id
+    """,
+    # $1 media ids served or handed out since the last flush
+    "touch_media": "UPDATE media SET last_used_at = now() WHERE id = ANY($1::uuid[])",
+    # $1 unused since, $2 batch size; rows being touched right now are skipped, not waited for
+    "gc_media": """
+        WITH doomed AS (
+            SELECT id FROM media
+             WHERE last_used_at < $1
+             ORDER BY last_used_at
+             LIMIT $2
+               FOR UPDATE SKIP LOCKED
+        )
+        DELETE FROM media m
+         USING doomed
+         WHERE m.id = doomed.id
+        RETURNING m.id, m.sha256, m.bytes IS NULL AS on_disk,
+                  COALESCE(m.size, octet_length(m.bytes), 0) AS size
+    """,
+    # $1 hashes; which of them still have a row
+    "media_hashes_in_use": "SELECT sha256 FROM media WHERE sha256 = ANY($1::bytea[])",
+
+    # ---------- spawns ----------
+    "spawn_channels": "SELECT channel_id FROM guild_spawn_channels WHERE guild_id = $1",
+    # $1 guild_id, $2 channel_id, $3 mob_name, $4 message_id, $5 spawn_time, $6 expires_at
+    "add_spawn": """
+        INSERT INTO active_spawns
+            (guild_id, channel_id, mob_name, message_id, revealed, spawn_time, expires_at)
+        VALUES ($1, $2, $3, $4, 0, $5, $6)
+        RETURNING spawn_id
+    """,
+    "live_spawns": """
+        SELECT spawn_id, channel_id, mob_name, spawn_time, expires_at
+          FROM active_spawns
+         WHERE expires_at > $1
+    """,
+    "sweep_expired_spawns": """
+        DELETE FROM active_spawns
+         WHERE expires_at <= $1
+        RETURNING spawn_id, channel_id, message_id, mob_name
+    """,
+
+    # Claiming, barn capacity and the barn insert are one statement, so when several
+    # people type the name at once exactly one of them gets a row back.
+    # $1 spawn_id, $2 user_id, $3 guild_id, $4 mob_name, $5 is_golden, $6 now, $7 hostile
+    "capture_spawn": """
+        WITH claim AS (
+            DELETE FROM active_spawns
+             WHERE spawn_id = $1 AND expires_at > $6
+            RETURNING spawn_id
+        ), player AS (
+            INSERT INTO new_players (guild_id, user_id)
+            SELECT $3, $2 FROM claim
+            ON CONFLICT DO NOTHING
+            RETURNING barn_size
+        ), upgrades AS (
+            INSERT INTO barn_upgrades (user_id, guild_id)
+            SELECT $2, $3 FROM claim
+            ON CONFLICT DO NOTHING
+        ), cap AS (
+            SELECT COALESCE(
+                       (SELECT barn_size FROM player),
+                       (SELECT barn_size FROM new_players WHERE user_id = $2 AND guild_id = $3)
+                   ) AS size,
+                   (SELECT COALESCE(SUM(count), 0) FROM barn WHERE user_id = $2 AND guild_id = $3) AS occ
+        ), placed AS (
+            INSERT INTO barn (user_id, guild_id, mob_name, is_golden, count)
+            SELECT $2, $3, $4, $5, 1 FROM claim, cap
+             WHERE NOT $7 AND cap.occ < cap.size
+            ON CONFLICT (user_id, mob_name, is_golden)
+            DO UPDATE SET count = barn.count + 1
+            RETURNING 1
+        )
+        SELECT cap.size, cap.occ, EXISTS (SELECT 1 FROM placed) AS placed
+          FROM claim, cap
+    """,
+}
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Pool connection that can preload registry statements into asyncpg's statement cache.
+
+    PreparedStatement objects die when a connection goes back to the pool, so the
+    statements live in the connection's own cache instead; conn.fetch() with the
+    exact same text then reuses them (and re-prepares on schema changes by itself).
+
+    asyncpg has no public way to fill that cache, so this calls the private
+    Connection._prepare(query, use_cache=True), as asyncpg 0.32 defines it; the
+    pin in requirements.txt keeps upgrades deliberate.
+    """
+
+    async def prepare_cached(self, sql: str):
+        await self._prepare(sql, use_cache=True)
+
+
+async def prepare_all(conn: PreparedConnection):
+    """Pool init hook: prepare every registered statement on a fresh connection."""
+    for name, sql in SQL.items():
+        try:
+            await conn.prepare_cached(sql)
+        except asyncpg.PostgresError as e:
+            # e.g. a table this deployment doesn't have; it gets prepared on first use instead
+            logging.warning(f"[queries] could not prepare {name}: {e}")
+
+
+async def fetch(conn, name: str, *args):
+    return await conn.fetch(SQL[name], *args)
+
+async def fetchrow(conn, name: str, *args):
+    return await conn.fetchrow(SQL[name], *args)
+
+async def fetchval(conn, name: str, *args):
+    return await conn.fetchval(SQL[name], *args)
+
+async def execute(conn, name: str, *args):
+    return await conn.execute(SQL[name], *args)
@@ -0,0 +1,339 @@
+"""Image rendering off the event loop, plus the spawn reveal frames and their LRU cache of encoded PNGs.
+
+Every PIL job goes through `await render.run(job_name, fn, *args)`, which runs the
+(module-level, picklable) function on a thread or process pool:
+
+    RENDER_EXECUTOR     "thread" (default) or "process"
+    RENDER_WORKERS      pool size (default: CPU count, at most 4)
+    RENDER_MAX_PENDING  jobs queued or running before callers wait (default: 8 per worker)
+    RENDER_WEBP         "0" to keep stored media PNG-only (default: lossless WebP allowed)
+
+Rendered images leave through encode(), which keeps the smallest exact encoding.
+"""
+import io
+import os
+import asyncio
+import logging
+import time
+import random
+import itertools
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image
+
+import metrics
+
+MOB_ASSET_DIR = "assets/mobs"
+
+PIXEL_LEVELS = [1, 2, 4, 8, 16, None]   # grid size; None = full resolution
+ZOOM_LEVELS  = [0.01, 0.05, 0.1, 0.2, 0.4, 1.0]
+
+RENDER_EXECUTOR    = os.getenv("RENDER_EXECUTOR", "thread").lower()
+RENDER_WORKERS     = int(os.getenv("RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", RENDER_WORKERS * 8))
+RENDER_WEBP        = os.getenv("RENDER_WEBP", "1") != "0"
+
+# encoded frames kept in memory, least recently used evicted first
+SPAWN_FRAME_CACHE_BYTES = int(os.getenv("SPAWN_FRAME_CACHE_MB", 64)) * 1024 * 1024
+# zoom focal points inside the same FOCAL_CELL x FOCAL_CELL pixel square share frames
+FOCAL_CELL = 4
+# opaque pixels kept per sprite as zoom centres (evenly strided when there are more)
+FOCAL_CANDIDATES_MAX = 4096
+
+
+def pixelate(img: Image.Image, size: int) -> Image.Image:
+    """Downscale to (size×size) then upscale back, nearest-neighbor."""
+    # shrink
+    small = img.resize((size, size), resample=Image.NEAREST)
+    # blow back up to original dims
+    return small.resize(img.size, Image.NEAREST)
+
+def zoom_frame_at(src: Image.Image, zoom_frac: float, center: tuple[float,float]) -> Image.Image:
+    """
+    Crop src to a zoom_frac× window centered at `center` (fractions 0–1),
+    then scale back up to full size.
+    """
+    crop = src.crop(zoom_box(src.size, zoom_frac, center))
+    return crop.resize(src.size, Image.NEAREST)
+
+def zoom_box(size: tuple[int, int], zoom_frac: float, center: tuple[float,float]) -> tuple[int, int, int, int]:
+    """The crop box zoom_frame_at uses."""
+    w, h = size
+    f = max(0.01, min(zoom_frac, 1.0))
+    cw, ch = int(w * f), int(h * f)
+
+    # compute top-left so the window is centered on (cx, cy)
+    cx, cy = center
+    left = int(cx * w - cw / 2)
+    top  = int(cy * h - ch / 2)
+    # clamp to image bounds
+    left = max(0, min(left, w - cw))
+    top  = max(0, min(top, h - ch))
+    return (left, top, left + cw, top + ch)
+
+
+# ---------- encoding ----------
+def _save(img: Image.Image, fmt: str, **params) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+def _exact_palette(img: Image.Image) -> Image.Image | None:
+    """img as a "P" image with an RGBA palette, or None if it has more than 256 colours."""
+    colors = img.getcolors(256)
+    if colors is None:
+        return None
+    # one 32-bit int per RGBA pixel, so the lookup below is a plain dict hit
+    index = {memoryview(bytes(c)).cast("I")[0]: i for i, (_, c) in enumerate(colors)}
+    pixels = memoryview(img.tobytes()).cast("I")
+    pal = Image.frombytes("P", img.size, bytes(index[v] for v in pixels))
+    pal.putpalette(b"".join(bytes(c) for _, c in colors), rawmode="RGBA")
+    return pal
+
+def encode(img: Image.Image, size: tuple[int, int] | None = None, webp: bool = True) -> tuple[bytes, str]:
+    """Smallest exact encoding of img, blown up to `size` (nearest neighbour) if given: (data, mime).
+
+    Pixel art has few colours and long runs, so a palette PNG or lossless WebP is
+    usually a fraction of the plain RGBA PNG. Every candidate is decoded again and
+    only kept if it gives back exactly the same pixels.
+    """
+    img = img.convert("RGBA")
+    size = size or img.size
+    big = img.resize(size, Image.NEAREST) if size != img.size else img
+    best = (_save(big, "PNG"), "image/png")
+    candidates = []
+    pal = _exact_palette(img)  # before scaling up: far fewer pixels to map
+    if pal is not None:
+        if size != img.size:
+            pal = pal.resize(size, Image.NEAREST)
+        candidates.append((_save(pal, "PNG", optimize=True), "image/png"))
+    if webp and RENDER_WEBP:
+        candidates.append((_save(big, "WEBP", lossless=True, exact=True), "image/webp"))
+
+    expected = None
+    for data, mime in candidates:
+        if len(data) >= len(best[0]):
+            continue
+        if expected is None:
+            expected = big.tobytes()
+        if Image.open(io.BytesIO(data)).convert("RGBA").tobytes() == expected:
+            best = (data, mime)
+    return best
+
+
+# ---------- render pool ----------
+_executor = None  # type: Executor | None
+_slots = None     # type: asyncio.Semaphore | None
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if RENDER_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+        logging.info(f"[render] {RENDER_EXECUTOR} pool with {RENDER_WORKERS} workers, {RENDER_MAX_PENDING} pending max")
+    return _executor
+
+def _timed_call(fn, args):
+    # runs in the worker; report pure render time separately from time spent queued
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+async def run(job: str, fn, *args):
+    """Run fn(*args) on the render pool and return its result.
+
+    Once RENDER_MAX_PENDING jobs are queued or running, callers wait here instead
+    of growing the pool's queue without bound.
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(RENDER_MAX_PENDING)
+    queued = time.perf_counter()
+    async with _slots:
+        result, took = await asyncio.get_running_loop().run_in_executor(_get_executor(), _timed_call, fn, args)
+    metrics.observe("beenbag_render_seconds", took, job=job)
+    metrics.observe("beenbag_render_wait_seconds", time.perf_counter() - queued - took, job=job)
+    return result
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# ---------- decoded sprites ----------
+# (path, mtime) -> decoded RGBA image. The asset index fills this in the main
+# process; process-pool workers fill their own copy on first use.
+_sprites = {}  # type: dict[tuple[str, float], Image.Image]
+
+def load_sprite(path: str, mtime: float) -> Image.Image:
+    """Decoded RGBA sprite for this version of the file, opened once per process."""
+    src = _sprites.get((path, mtime))
+    if src is None:
+        src = _sprites[(path, mtime)] = Image.open(path).convert("RGBA")
+    return src
+
+
+# ---------- mob asset index ----------
+# MOBS key -> one entry per variant image:
+#   {"path", "mtime", "image", "size", "bbox", "focal"}
+#   bbox  = alpha bounding box or None
+#   focal = flat indices (y * width + x) of opaque pixels, zoom reveal centres to pick from
+# A mob is either assets/mobs/<Mob>.png or a folder assets/mobs/<Mob>/ of variants.
+_mob_assets = {}  # type: dict[str, list[dict]]
+
+def _mob_files(mob: str) -> list[str]:
+    mob_path = f"{MOB_ASSET_DIR}/{mob}"
+    if os.path.isdir(mob_path):
+        return sorted(
+            os.path.join(mob_path, f) for f in os.listdir(mob_path)
+            if f.lower().endswith((".png", ".jpg", ".jpeg"))
+        )
+    if os.path.isfile(f"{mob_path}.png"):
+        return [f"{mob_path}.png"]
+    return []
+
+def _focal_candidates(alpha: Image.Image) -> array:
+    # one C-level pass over the alpha bytes: keep the index of every non-zero pixel
+    w, h = alpha.size
+    opaque = array("I", itertools.compress(range(w * h), alpha.tobytes()))
+    if len(opaque) > FOCAL_CANDIDATES_MAX:
+        opaque = opaque[::-(-len(opaque) // FOCAL_CANDIDATES_MAX)]
+    return opaque
+
+def _index_sprite(path: str, mtime: float) -> dict:
+    image = load_sprite(path, mtime)
+    alpha = image.getchannel("A")
+    return {
+        "path": path,
+        "mtime": mtime,
+        "image": image,
+        "size": image.size,
+        "bbox": alpha.getbbox(),
+        "focal": _focal_candidates(alpha),
+    }
+
+def build_mob_index(mob_names) -> dict:
+    """(Re)scan the sprite folders; only new or modified files are decoded again.
+
+    Returns {"sprites": n, "changed": n, "missing": [mobs without any image]}.
+    """
+    old = {a["path"]: a for assets in _mob_assets.values() for a in assets}
+    index, changed, missing = {}, 0, []
+    for mob in mob_names:
+        assets = []
+        for path in _mob_files(mob):
+            try:
+                mtime = os.path.getmtime(path)
+                asset = old.get(path)
+                if asset is None or asset["mtime"] != mtime:
+                    asset = _index_sprite(path, mtime)
+                    changed += 1
+                assets.append(asset)
+            except OSError as e:
+                logging.warning(f"[render] skipping unreadable sprite {path}: {e}")
+        if assets:
+            index[mob] = assets
+        else:
+            missing.append(mob)
+
+    # forget decoded images and cached frames of files that changed or disappeared
+    live = {(a["path"], a["mtime"]) for assets in index.values() for a in assets}
+    for key in [k for k in _sprites if k not in live]:
+        del _sprites[key]
+    _drop_frames([k for k in _frames if (k[0], k[1]) not in live])
+
+    # reloads run off the event loop: spawns keep seeing a full index while it is swapped
+    _mob_assets.update(index)
+    for mob in [m for m in _mob_assets if m not in index]:
+        del _mob_assets[mob]
+    sprites = sum(len(a) for a in index.values())
+    logging.info(f"[render] indexed {sprites} sprites for {len(index)} mobs ({changed} decoded)")
+    if missing:
+        logging.warning(f"[render] mobs with no image: {', '.join(missing)}")
+    return {"sprites": sprites, "changed": changed, "missing": missing}
+
+def pick_focal(asset: dict) -> tuple[int, int] | None:
+    """Random opaque pixel of the sprite to centre zoom frames on; None if it is fully transparent."""
+    if not asset["focal"]:
+        return None
+    i = random.choice(asset["focal"])
+    return (i % asset["size"][0], i // asset["size"][0])
+
+def pick_sprite(mob: str) -> dict | None:
+    """A random variant of this mob's sprite from the index, or None if it has none."""
+    assets = _mob_assets.get(mob)
+    return random.choice(assets) if assets else None
+
+
+# ---------- frame cache ----------
+_frames = OrderedDict()  # type: OrderedDict[tuple, bytes]
+_frame_bytes = 0
+
+def _frame_key(path: str, mtime: float, mode: str, level, focal: tuple[int, int] | None) -> tuple:
+    if mode == "zoom" and level < 1.0 and focal is not None:
+        bucket = (focal[0] // FOCAL_CELL, focal[1] // FOCAL_CELL)
+    else:
+        bucket = None  # pixel frames and the full zoom-out don't depend on the focal point
+    return (path, mtime, mode, level, bucket)
+
+def _drop_frames(keys):
+    global _frame_bytes
+    for key in keys:
+        _frame_bytes -= len(_frames.pop(key))
+
+def _render(path: str, mtime: float, mode: str, level, focal: tuple[int, int] | None) -> bytes:
+    src = load_sprite(path, mtime)
+    w, h = src.size
+    # encode the small image before it is scaled back up (same pixels as pixelate / zoom_frame_at)
+    if mode == "pixel":
+        small = src.resize((level, level), Image.NEAREST) if level else src
+    else:
+        cx, cy = focal if focal is not None else (w // 2, h // 2)
+        small = src.crop(zoom_box(src.size, level, (cx / w, cy / h)))
+    # PNG only: every frame replaces the same attachment://spawn.png
+    return encode(small, (w, h), webp=False)[0]
+
+async def spawn_frame(asset: dict, mode: str, level, focal: tuple[int, int] | None = None) -> bytes:
+    """PNG bytes for one reveal frame of an indexed sprite (see pick_sprite).
+
+    mode "pixel": level is the pixelation grid size (None = full size).
+    mode "zoom":  level is the zoom fraction, focal the (x, y) pixel to centre on.
+    """
+    global _frame_bytes
+    path, mtime = asset["path"], asset["mtime"]
+    key = _frame_key(path, mtime, mode, level, focal)
+    png = _frames.get(key)
+    if png is not None:
+        _frames.move_to_end(key)
+        metrics.inc("beenbag_spawn_frame_cache_total", result="hit")
+        return png
+
+    metrics.inc("beenbag_spawn_frame_cache_total", result="miss")
+    png = await run("spawn_frame", _render, path, mtime, mode, level, focal)
+    if key in _frames:
+        return _frames[key]  # another spawn rendered it while we waited
+    _frames[key] = png
+    _frame_bytes += len(png)
+    while _frame_bytes > SPAWN_FRAME_CACHE_BYTES and len(_frames) > 1:
+        _, old = _frames.popitem(last=False)
+        _frame_bytes -= len(old)
+    return png
+
+
+async def warm_spawn_frames():
+    """Pre-render every focal-independent frame (all pixel levels, full zoom) for every indexed sprite."""
+    start = time.perf_counter()
+    assets = [a for variants in _mob_assets.values() for a in variants]
+    await asyncio.gather(*(
+        spawn_frame(asset, mode, level)
+        for asset in assets
+        for mode, level in [("pixel", lvl) for lvl in PIXEL_LEVELS] + [("zoom", ZOOM_LEVELS[-1])]
+    ))
+    logging.info(f"[render] warmed {len(_frames)} spawn frames for {len(assets)} sprites "
+                 f"({_frame_bytes // 1024} KiB) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,82 @@
+"""One timer heap and one runner task for every delayed job the bot owns
+(per-guild spawn ticks, spawn reveal frames, spawn expiries)."""
+import asyncio
+import heapq
+import itertools
+import logging
+
+
+class Scheduler:
+    """Keyed one-shot timers on a heap.
+
+    Scheduling under a key that is already pending replaces that job, and
+    cancel() is O(1) (stale heap entries are skipped when they surface).
+    Due jobs run as their own tasks, at most `max_concurrency` at a time;
+    when that many are in flight the runner waits instead of piling up more.
+    """
+
+    def __init__(self, max_concurrency: int = 32):
+        self._heap = []   # (loop time, seq, key)
+        self._jobs = {}   # key -> (seq, callback, args)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._running = set()
+        self._runner = None
+
+    def call_later(self, delay: float, key, callback, *args):
+        """Run `await callback(*args)` in `delay` seconds, replacing any job pending under `key`."""
+        when = asyncio.get_running_loop().time() + max(0.0, delay)
+        seq = next(self._seq)
+        self._jobs[key] = (seq, callback, args)
+        heapq.heappush(self._heap, (when, seq, key))
+        if self._heap[0][1] == seq:
+            self._wake.set()  # new earliest deadline
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._compact()
+
+    def cancel(self, key) -> bool:
+        return self._jobs.pop(key, None) is not None
+
+    def pending(self, key) -> bool:
+        return key in self._jobs
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    def _compact(self):
+        self._heap = [e for e in self._heap if self._jobs.get(e[2], (None,))[0] == e[1]]
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wake.clear()
+            while self._heap and self._heap[0][0] <= loop.time():
+                _, seq, key = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+                if job is None or job[0] != seq:
+                    continue  # cancelled or replaced
+                del self._jobs[key]
+                await self._slots.acquire()
+                task = asyncio.create_task(self._dispatch(key, job[1], job[2]))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            timeout = self._heap[0][0] - loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, key, callback, args):
+        try:
+            await callback(*args)
+        except Exception:
+            logging.exception(f"[scheduler] job {key!r} failed")
+        finally:
+            self._slots.release()
@@ -159,12 +159,3 @@ class PathButtons(discord.ui.View):
             view=self
         )
         await self.give_loot()
-
-# make sure give_items is implemented:
-async def give_items(user_id, item_name, amount, category, useable, conn, guild_id):
-    await conn.execute("""
-        INSERT INTO player_items (player_id, guild_id, item_name, quantity, category, useable)
-        VALUES ($1, $2, $3, $4, $5, $6)
-        ON CONFLICT (player_id, guild_id, item_name)
-        DO UPDATE SET quantity = player_items.quantity + EXCLUDED.quantity
-    """, user_id, guild_id, item_name, amount, category, useable)
@@ -0,0 +1,52 @@
+"""tint_image_sync against the per-pixel loop it replaced."""
+import os
+import random
+import sys
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("PUBLIC_BASE_URL", "http://localhost")  # utils refuses to import without it
+
+import cc
+from constants import FISHTYPES, MINECRAFT_COLORS
+
+
+def reference_tint(image: Image.Image, tint: tuple[int, int, int]) -> Image.Image:
+    """The original getpixel/putpixel implementation."""
+    image = image.convert("RGBA")
+    width, height = image.size
+
+    result = Image.new("RGBA", (width, height))
+
+    for x in range(width):
+        for y in range(height):
+            r, g, b, a = image.getpixel((x, y))
+            if a == 0:
+                result.putpixel((x, y), (0, 0, 0, 0))
+                continue
+
+            brightness = r / 255
+            tinted = tuple(int(c * brightness) for c in tint)
+            result.putpixel((x, y), (*tinted, a))
+
+    return result
+
+
+@pytest.mark.parametrize("color", sorted(MINECRAFT_COLORS))
+@pytest.mark.parametrize("layer", ["base.png", "overlay.png"])
+@pytest.mark.parametrize("fish_type", FISHTYPES)
+def test_fish_layers_match_reference(fish_type, layer, color):
+    image = Image.open(os.path.join(ROOT, "assets", "fish", fish_type, layer))
+    tint = MINECRAFT_COLORS[color]
+    assert cc.tint_image_sync(image, tint).tobytes() == reference_tint(image, tint).tobytes()
+
+
+def test_noise_matches_reference():
+    # every red and alpha value, including colour under fully transparent pixels
+    rng = random.Random(16)
+    image = Image.frombytes("RGBA", (64, 64), bytes(rng.randrange(256) for _ in range(64 * 64 * 4)))
+    for tint in [(0, 0, 0), (255, 255, 255), (1, 128, 254)]:
+        assert cc.tint_image_sync(image, tint).tobytes() == reference_tint(image, tint).tobytes()
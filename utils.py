@@ -15,7 +15,12 @@ from zoneinfo import ZoneInfo
 import string
 import secrets
 import re
+from bisect import bisect_right
+from itertools import accumulate
 from constants import *
+import queries as q
+import mediastore
+import outbound
 
 async def init_util(dab_pool):
     pass
@@ -24,16 +29,64 @@ if not PUBLIC_BASE_URL:
     raise RuntimeError("PUBLIC_BASE_URL environment variable not set")
 
 
-def media_url(media_id: str) -> str:
-    # nice .png suffix for Discord preview; path still resolves by id only
-    return f"{PUBLIC_BASE_URL}/i/{media_id}.png"
+def media_url(media_id: str, mime: str = "image/png") -> str:
+    # suffix matching the stored format for Discord preview; path still resolves by id only
+    return f"{PUBLIC_BASE_URL}/i/{media_id}{mediastore.suffix_for(mime)}"
 
 async def save_image_bytes(conn: asyncpg.Connection, data: bytes, mime: str = "image/png") -> str:
-    rec = await conn.fetchrow(
-        "INSERT INTO media (mime, bytes) VALUES ($1, $2) RETURNING id",
-        mime, data
-    )
-    return str(rec["id"])
+    """Store a rendered image (see mediastore) and return its media id."""
+    return await mediastore.save(conn, data, mime)
+
+# ---------- guild settings cache ----------
+# guild_id -> channel config; bulk-loaded at startup, then kept current by the admin commands
+_guild_settings = {}  # type: dict[int, dict]
+_SETTINGS_ARRAYS = ("link_channel_ids", "react_channel_ids", "game_channel_ids")
+
+def _default_guild_settings() -> dict:
+    return {
+        "announce_channel_id": None,
+        "log_channel_id": None,
+        "link_channel_ids": set(),
+        "react_channel_ids": set(),
+        "game_channel_ids": set(),
+        "welcome_enabled": True,
+    }
+
+async def warm_guild_settings(pool):
+    """Load every guild's channel settings into memory."""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT guild_id, announce_channel_id, log_channel_id,
+                   link_channel_ids, react_channel_ids, game_channel_ids,
+                   COALESCE(welcome_enabled, TRUE) AS welcome_enabled
+              FROM guild_settings
+        """)
+    _guild_settings.clear()
+    for r in rows:
+        update_guild_settings(
+            r["guild_id"],
+            announce_channel_id=r["announce_channel_id"],
+            log_channel_id=r["log_channel_id"],
+            link_channel_ids=r["link_channel_ids"],
+            react_channel_ids=r["react_channel_ids"],
+            game_channel_ids=r["game_channel_ids"],
+            welcome_enabled=r["welcome_enabled"],
+        )
+
+def get_guild_settings(guild_id: int) -> dict:
+    """Cached settings for a guild (defaults if it was never configured). Don't mutate the result."""
+    settings = _guild_settings.get(guild_id)
+    if settings is None:
+        return _default_guild_settings()
+    return settings
+
+def update_guild_settings(guild_id: int, **fields):
+    """Mirror a guild_settings write into the cache. Call after the DB write succeeded."""
+    settings = _guild_settings.setdefault(guild_id, _default_guild_settings())
+    for key, value in fields.items():
+        if key in _SETTINGS_ARRAYS:
+            value = set(value or [])
+        settings[key] = value
 
 
 async def giverole(ctx:commands.Context, id: int, user):
@@ -67,18 +120,7 @@ async def sucsac(ctx:commands.Context, user, mob_name: str, is_gold: bool, note:
     color   = COLOR_MAP[rar_info["colour"]]
 
     #check sword
-    swords = await conn.fetch(
-        """
-        SELECT tier, uses_left
-            FROM tools
-            WHERE user_id = $1
-            AND guild_id = $2
-            AND tool_name = 'sword'
-            AND uses_left > 0
-        """,
-        user_id,
-        guild_id
-    )
+    swords = await q.fetch(conn, "usable_tools", user_id, guild_id, "sword")
     owned_tiers = {r["tier"] for r in swords}
     best_tier = None
     for tier in reversed(TIER_ORDER):
@@ -89,30 +131,12 @@ async def sucsac(ctx:commands.Context, user, mob_name: str, is_gold: bool, note:
         reward*=2
     num = SWORDS[best_tier]
     reward += num
-    await conn.execute(
-        """
-        UPDATE tools
-            SET uses_left = uses_left - 1
-            WHERE user_id = $1
-            AND guild_id = $2
-            AND tool_name = 'sword'
-            AND tier = $3
-            AND uses_left > 0
-        """,
-        user_id, guild_id, best_tier
-    )
+    await q.execute(conn, "use_tool", user_id, guild_id, "sword", best_tier)
 
     # grant emeralds
     await give_items(user_id,"emeralds",reward,"emeralds",False,conn,guild_id)
     # record in sacrifice_history
-    await conn.execute(
-        """
-        INSERT INTO sacrifice_history
-            (discord_id, guild_id, mob_name, is_golden, rarity)
-        VALUES ($1,$2,$3,$4,$5)
-        """,
-        user_id, guild_id, key, is_gold, rarity
-    )
+    await q.execute(conn, "record_sacrifice", user_id, guild_id, key, is_gold, rarity)
 
     # send embed
     embed = discord.Embed(
@@ -172,51 +196,64 @@ async def resolve_member(ctx: commands.Context, query: str) -> discord.Member |
             return m
 
     return None
+# LEVEL_EXP flattened for bisection: thresholds ascending, and the highest level reached at each one
+_LEVEL_STEPS = sorted((req, level) for level, req in LEVEL_EXP.items())
+_LEVEL_THRESHOLDS = [req for req, _ in _LEVEL_STEPS]
+_LEVEL_AT = list(accumulate((level for _, level in _LEVEL_STEPS), max))
+
 def get_level_from_exp(exp: int) -> int:
     # find the highest level whose threshold is <= exp
-    lvl = 0
-    for level, req in LEVEL_EXP.items():
-        if exp >= req and level > lvl:
-            lvl = level
-    return lvl
+    i = bisect_right(_LEVEL_THRESHOLDS, exp)
+    return _LEVEL_AT[i - 1] if i else 0
+
+# ---------- level role cache ----------
+# guild_id -> {milestone level: role_id}, loaded from guild_level_roles at startup.
+# Nothing in the bot writes that table, so edits made directly in the DB need a restart.
+_level_roles = {}  # type: dict[int, dict[int, int]]
+
+async def warm_level_roles(pool):
+    """Load every guild's milestone role ids into memory."""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT guild_id, level, role_id FROM guild_level_roles")
+    _level_roles.clear()
+    for r in rows:
+        _level_roles.setdefault(r["guild_id"], {})[r["level"]] = r["role_id"]
+
+def get_level_role_id(guild_id: int, level: int) -> int | None:
+    return _level_roles.get(guild_id, {}).get(level)
 
 async def gain_exp(conn, bot, user_id: int, exp_gain: int, message=None, guild_id: int=None):
     if guild_id is None:
         guild_id = message.guild.id if message and message.guild else None
 
-    old_exp = await conn.fetchval("""
-        SELECT experience FROM accountinfo
-         WHERE guild_id = $1 AND discord_id = $2
-    """, guild_id, user_id) or 0
+    row = await q.fetchrow(conn, "gain_exp", user_id, guild_id, exp_gain)
+    if row is None:
+        return
 
-    new_exp = old_exp + exp_gain
-    await conn.execute("""
-        UPDATE accountinfo
-           SET experience = $1, overallexp = overallexp + $2
-         WHERE guild_id = $3 AND discord_id = $4
-    """, new_exp, exp_gain, guild_id, user_id)
+    await apply_level_up(bot, guild_id, user_id, row["old_exp"], row["new_exp"], message.channel if message else None)
 
+async def apply_level_up(bot, guild_id: int, user_id: int, old_exp: int, new_exp: int, channel=None):
+    """
+    Announce a level-up and swap milestone roles if going from old_exp to new_exp
+    crossed a level. `channel` is the fallback when the guild has no announce channel.
+    """
     old_lvl = get_level_from_exp(old_exp)
     new_lvl = get_level_from_exp(new_exp)
     if new_lvl <= old_lvl:
         return
 
-    announce_id = await conn.fetchval("""
-        SELECT announce_channel_id FROM guild_settings WHERE guild_id = $1
-    """, guild_id)
+    announce_id = get_guild_settings(guild_id)["announce_channel_id"]
     announce_ch = bot.get_channel(announce_id) if announce_id else None
 
     # adjust roles per guild
-    if message and message.guild:
-        guild = message.guild
+    guild = bot.get_guild(guild_id) if guild_id else None
+    if guild:
         member = guild.get_member(user_id)
 
         # remove previous milestone role
         prev_milestone = max([m for m in MILESTONE_ROLES if m < new_lvl], default=None)
         if prev_milestone:
-            prev_role_id = await conn.fetchval("""
-                SELECT role_id FROM guild_level_roles WHERE guild_id = $1 AND level = $2
-            """, guild_id, prev_milestone)
+            prev_role_id = get_level_role_id(guild_id, prev_milestone)
             if prev_role_id and member:
                 old_role = guild.get_role(prev_role_id)
                 if old_role in member.roles:
@@ -224,76 +261,40 @@ async def gain_exp(conn, bot, user_id: int, exp_gain: int, message=None, guild_i
 
         # add new milestone role
         if new_lvl in MILESTONE_ROLES:
-            role_id = await conn.fetchval("""
-                SELECT role_id FROM guild_level_roles WHERE guild_id = $1 AND level = $2
-            """, guild_id, new_lvl)
+            role_id = get_level_role_id(guild_id, new_lvl)
             if role_id and member:
                 new_role = guild.get_role(role_id)
                 if new_role:
                     await member.add_roles(new_role, reason="Leveled up")
 
     text = f"🎉 <@{user_id}> leveled up to **Level {new_lvl}**!"
-    if announce_ch:
-        await announce_ch.send(text)
-    elif message:
-        await message.channel.send(text)
+    if announce_ch or channel:
+        outbound.send(announce_ch or channel, outbound.NORMAL, content=text)
 
 async def ensure_player(conn, user_id, guild_id: int):
-        await conn.execute(
-            "INSERT INTO new_players (guild_id, user_id) VALUES ($1,$2) ON CONFLICT DO NOTHING;",
-            guild_id,user_id
-        )
-
-async def take_items(user_id: int, item: str, amount: int,conn, guild_id:int):
-    # Check current quantity
-    row = await conn.fetchrow("""
-        SELECT quantity FROM player_items
-        WHERE guild_id = $1 AND player_id = $2 AND item_name = $3
-    """, guild_id, user_id, item)
-
-    if not row or row["quantity"] < amount:
-        raise ValueError(f"User {user_id} does not have enough of '{item}' (has {row['quantity'] if row else 0})")
+        await q.execute(conn, "ensure_player", user_id, guild_id)
 
-    new_qty = row["quantity"] - amount
+async def take_items(user_id: int, item: str, amount: int,conn, guild_id:int) -> int:
+    """Remove `amount` of an item and return what is left; ValueError (and no change) if they have less.
 
-    if new_qty > 0:
-        await conn.execute("""
-            UPDATE player_items
-            SET quantity = $1
-            WHERE guild_id = $2 AND player_id = $3 AND item_name = $4
-        """, new_qty, guild_id, user_id, item)
-    else:
-        await conn.execute("""
-            DELETE FROM player_items
-            WHERE guild_id = $1 AND player_id = $2 AND item_name = $3
-        """, guild_id, user_id, item)
-
-async def give_items(user_id: int, item: str, amount: int, cat, useable, conn, guild_id: int):
-    # Check if item already exists
-    row = await conn.fetchrow("""
-        SELECT quantity FROM player_items
-        WHERE guild_id = $1 AND player_id = $2 AND item_name = $3
-    """,guild_id, user_id, item)
-
-    if row:
-        new_qty = row["quantity"] + amount
-        await conn.execute("""
-            UPDATE player_items
-            SET quantity = $1
-            WHERE guild_id = $2 AND player_id = $3 AND item_name = $4
-        """, new_qty, guild_id, user_id, item)
-    else:
-        await conn.execute("""
-            INSERT INTO player_items (guild_id, player_id, item_name, category, quantity, useable)
-            VALUES ($1, $2, $3, $4, $5, $6)
-        """, guild_id, user_id, item, cat, amount, useable)
+    Callers that check the balance first (for a friendlier message) must still handle
+    the ValueError: another command can spend the items between the check and the take.
+    """
+    # the balance check and the decrement are one statement, so concurrent takes can't overdraw
+    new_qty = await q.fetchval(conn, "take_item", user_id, guild_id, item, amount)
+    if new_qty is None:
+        raise ValueError(f"User {user_id} does not have {amount} of '{item}'")
+    if new_qty == 0:
+        await q.execute(conn, "delete_empty_item", user_id, guild_id, item)
+    return new_qty
+
+async def give_items(user_id: int, item: str, amount: int, cat, useable, conn, guild_id: int) -> int:
+    """Add `amount` of an item (creating the row if needed) and return the new total."""
+    return await q.fetchval(conn, "give_item", user_id, guild_id, item, amount, cat, useable)
 
 async def get_items(conn,user_id, item,guild_id:int):
 
-    row = await conn.fetchrow("""
-        SELECT quantity FROM player_items
-        WHERE guild_id = $1 AND player_id = $2 AND item_name = $3
-    """, guild_id, user_id, item)
+    row = await q.fetchrow(conn, "item_quantity", user_id, guild_id, item)
     if not row:
         return 0
     else:
@@ -301,22 +302,5 @@ async def get_items(conn,user_id, item,guild_id:int):
 
 async def give_mob(conn,user_id, mob,guild_id):
     key = mob.title()
-    await conn.execute(
-        """
-        INSERT INTO barn (user_id, guild_id, mob_name, is_golden, count)
-        VALUES ($1, $2, $3, false, 1)
-        ON CONFLICT (user_id, mob_name, is_golden)
-        DO UPDATE SET count = barn.count + 1;
-        """,
-        user_id, guild_id, key
-    )
-    # 7) Fetch new total
-    new_count = await conn.fetchval(
-        """
-        SELECT count
-            FROM barn
-            WHERE user_id=$1 AND mob_name=$2 AND is_golden=false
-        """,
-        user_id, key
-    )
-    return new_count
+    # upsert and read back the new total in one go
+    return await q.fetchval(conn, "give_mob", user_id, guild_id, key)